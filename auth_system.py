@@ -8,15 +8,21 @@ import hashlib
 import secrets
 from datetime import datetime, timedelta
 from typing import Dict, Optional
-from user_management import UserManagement
+from metrics import REGISTRY
+from user_management import STORAGE_WRITE_ERRORS, STORAGE_WRITE_SECONDS, UserManagement
+
+AUTH_ATTEMPTS = REGISTRY.counter(
+    'kropscan_auth_attempts_total', 'Registrations, logins and logouts by outcome', ('action', 'result'))
 
 class AuthSystem:
     """Handles user authentication and session management"""
 
-    def __init__(self, users_file="users.json", sessions_file="sessions.json", admin_email="admin@kropscan.ai", admin_password="admin123"):
+    def __init__(self, users_file="users.json", sessions_file="sessions.json", admin_email="admin@kropscan.ai", admin_password="admin123",
+                 user_manager: UserManagement = None):
         self.users_file = users_file
         self.sessions_file = sessions_file
-        self.user_manager = UserManagement(users_file)
+        # Pass the process's shared UserManagement so every component sees the same users
+        self.user_manager = user_manager or UserManagement(users_file)
         self.sessions = self.load_sessions()
 
         # Initialize admin account if it doesn't exist
@@ -27,35 +33,37 @@ class AuthSystem:
     def initialize_admin_account(self):
         """Initialize admin account if it doesn't exist"""
         # Check if admin account already exists
-        for user_id, user_data in self.user_manager.users.items():
-            if user_data.get('email') == self.admin_email:
-                # Ensure this user is marked as admin
-                if not user_data.get('is_admin', False):
-                    user_data['is_admin'] = True
-                    self.user_manager.save_users()
-                return
-
-        # Create admin account
-        admin_user_id = self.user_manager.register_user(
+        user_data = self.user_manager.find_user_by_email(self.admin_email)
+        if user_data:
+            # Ensure this user is marked as admin
+            if not user_data.get('is_admin', False):
+                self.user_manager.update_user(user_data['user_id'], lambda user: user.update(is_admin=True))
+            return
+
+        # Create admin account (with its admin-specific data in the same write)
+        self.user_manager.register_user(
             "Admin User",
             "9999999999",  # Phone
             "KropScan Admin",  # Location
-            0.0  # Farm size
+            0.0,  # Farm size
+            **self._account_fields(self.admin_email, self.hash_password(self.admin_password), is_admin=True)
         )
 
-        if admin_user_id:
-            # Set admin-specific data
-            self.user_manager.users[admin_user_id]['email'] = self.admin_email
-            self.user_manager.users[admin_user_id]['password'] = self.hash_password(self.admin_password)
-            self.user_manager.users[admin_user_id]['is_admin'] = True
-            self.user_manager.users[admin_user_id]['created_at'] = datetime.now().isoformat()
-            self.user_manager.users[admin_user_id]['last_login'] = None
-            self.user_manager.users[admin_user_id]['preferences'] = {
+    @staticmethod
+    def _account_fields(email: str, hashed_password: str, is_admin: bool = False) -> Dict:
+        """Login fields stored alongside the user's profile"""
+        return {
+            'email': email,
+            'password': hashed_password,
+            'is_admin': is_admin,
+            'created_at': datetime.now().isoformat(),
+            'last_login': None,
+            'preferences': {
                 'theme': 'default',
                 'language': 'en',
                 'notifications_enabled': True
             }
-            self.user_manager.save_users()
+        }
 
     def load_sessions(self) -> Dict:
         """Load active sessions from file"""
@@ -70,9 +78,10 @@ class AuthSystem:
     def save_sessions(self):
         """Save active sessions to file"""
         try:
-            with open(self.sessions_file, 'w') as f:
+            with STORAGE_WRITE_SECONDS.labels('sessions').time(), open(self.sessions_file, 'w') as f:
                 json.dump(self.sessions, f, indent=2)
         except Exception as e:
+            STORAGE_WRITE_ERRORS.labels('sessions').inc()
             print(f"Error saving sessions: {e}")
     
     def hash_password(self, password: str) -> str:
@@ -97,53 +106,45 @@ class AuthSystem:
     def register_user(self, name: str, email: str, phone: str, password: str, location: str, farm_size: float = 0.0, is_admin: bool = False) -> Optional[str]:
         """Register a new user"""
         # Check if email already exists
-        for user_id, user_data in self.user_manager.users.items():
-            if user_data.get('email') == email:
-                return None  # Email already exists
+        if self.user_manager.find_user_by_email(email):
+            AUTH_ATTEMPTS.labels('register', 'duplicate_email').inc()
+            return None  # Email already exists
 
         # Hash the password
         hashed_password = self.hash_password(password)
 
-        # Register user with user management system
-        user_id = self.user_manager.register_user(name, phone, location, farm_size)
+        # Register user with user management system (profile + login fields in one write)
+        user_id = self.user_manager.register_user(
+            name, phone, location, farm_size, **self._account_fields(email, hashed_password, is_admin))
 
         if user_id:
-            # Add email and password to user data
-            self.user_manager.users[user_id]['email'] = email
-            self.user_manager.users[user_id]['password'] = hashed_password
-            self.user_manager.users[user_id]['is_admin'] = is_admin  # Set admin status
-            self.user_manager.users[user_id]['created_at'] = datetime.now().isoformat()
-            self.user_manager.users[user_id]['last_login'] = None
-            self.user_manager.users[user_id]['preferences'] = {
-                'theme': 'default',
-                'language': 'en',
-                'notifications_enabled': True
-            }
-            self.user_manager.save_users()
+            AUTH_ATTEMPTS.labels('register', 'success').inc()
             return user_id
 
+        # Lost a race with a concurrent registration of the same email
+        result = 'duplicate_email' if self.user_manager.find_user_by_email(email) else 'failure'
+        AUTH_ATTEMPTS.labels('register', result).inc()
         return None
     
     def login_user(self, email: str, password: str) -> Optional[str]:
         """Login user and return session token"""
         # Find user by email
-        user_id = None
-        for uid, user_data in self.user_manager.users.items():
-            if user_data.get('email') == email:
-                user_id = uid
-                break
+        user_data = self.user_manager.find_user_by_email(email)
 
-        if not user_id:
+        if not user_data:
+            AUTH_ATTEMPTS.labels('login', 'unknown_user').inc()
             return None
 
         # Verify password
-        stored_hash = self.user_manager.users[user_id]['password']
+        stored_hash = user_data['password']
         if not self.verify_password(password, stored_hash):
+            AUTH_ATTEMPTS.labels('login', 'bad_password').inc()
             return None
 
         # Update last login
-        self.user_manager.users[user_id]['last_login'] = datetime.now().isoformat()
-        self.user_manager.save_users()
+        user_id = user_data['user_id']
+        last_login = datetime.now().isoformat()
+        self.user_manager.update_user(user_id, lambda user: user.update(last_login=last_login))
 
         # Create session
         session_token = secrets.token_urlsafe(32)
@@ -151,9 +152,10 @@ class AuthSystem:
             'user_id': user_id,
             'created_at': datetime.now().isoformat(),
             'expires_at': (datetime.now() + timedelta(days=7)).isoformat(),  # 7 days expiry
-            'is_admin': self.user_manager.users[user_id].get('is_admin', False)  # Include admin status
+            'is_admin': user_data.get('is_admin', False)  # Include admin status
         }
         self.save_sessions()
+        AUTH_ATTEMPTS.labels('login', 'success').inc()
 
         return session_token
 
@@ -168,7 +170,9 @@ class AuthSystem:
         if session_token in self.sessions:
             del self.sessions[session_token]
             self.save_sessions()
+            AUTH_ATTEMPTS.labels('logout', 'success').inc()
             return True
+        AUTH_ATTEMPTS.labels('logout', 'unknown_session').inc()
         return False
     
     def get_user_from_session(self, session_token: str) -> Optional[Dict]:
@@ -194,13 +198,8 @@ class AuthSystem:
     
     def update_user_preferences(self, user_id: str, preferences: Dict) -> bool:
         """Update user preferences"""
-        if user_id in self.user_manager.users:
-            if 'preferences' not in self.user_manager.users[user_id]:
-                self.user_manager.users[user_id]['preferences'] = {}
-            self.user_manager.users[user_id]['preferences'].update(preferences)
-            self.user_manager.save_users()
-            return True
-        return False
+        return self.user_manager.update_user(
+            user_id, lambda user: user.setdefault('preferences', {}).update(preferences))
     
     def get_user_preferences(self, user_id: str) -> Dict:
         """Get user preferences"""
@@ -1,157 +1,393 @@
-# benchmark.py - Test and benchmark the enhanced KropScan AI
+# benchmark.py - Reproducible inference benchmark for the KropScan AI engine
+"""
+Measures the inference pipeline per backend and writes JSON that can be
+compared across commits.
+
+Every backend runs in a fresh subprocess so cold start and peak RSS are
+measured in isolation. Each run reports:
+- cold start: import, model load and first prediction
+- single-image latency percentiles
+- throughput at several batch sizes and torch thread counts
+- per-stage latency percentiles from KropScanAI.get_stats()
+- peak resident memory
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --backends eager onnxruntime --compare bench_main.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
 import time
-import torch
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
 from PIL import Image
-import io
-import os
-from ai_engine import KropScanAI
-
-def create_test_image(size=(380, 380)):
-    """Create a test image for benchmarking"""
-    # Create a realistic test image
-    image = Image.new('RGB', size, color='green')
-    # Add some patterns to make it look like a leaf
-    pixels = image.load()
-    for i in range(size[0]):
-        for j in range(size[1]):
-            if (i - size[0]//2)**2 + (j - size[1]//2)**2 < (size[0]//3)**2:
-                # Center area - make it more leaf-like
-                pixels[i, j] = (34, 139, 34)  # Forest green
-            else:
-                # Edge area - add some variation
-                pixels[i, j] = (20, 100, 20)
-    
-    # Add some "disease spots"
-    for i in range(50, 100):
-        for j in range(50, 100):
-            if (i - 75)**2 + (j - 75)**2 < 25**2:
-                pixels[i, j] = (139, 69, 19)  # Brown spot
-    
-    return image
-
-def benchmark_model():
-    """Run comprehensive benchmarks on the enhanced model"""
-    print("="*80)
-    print("🚀 KROPSCAN ENHANCED MODEL BENCHMARK")
-    print("="*80)
-    
-    # Initialize AI engine
-    print("\n🔧 Loading Enhanced AI Engine...")
+
+PROCESS_START = time.perf_counter()
+
+BACKENDS = ('eager', 'torchscript', 'onnxruntime', 'quantized')
+
+
+# ============================================================================
+# SYNTHETIC CORPUS
+# ============================================================================
+
+def make_leaf_image(rng: np.random.Generator, size: Tuple[int, int]) -> np.ndarray:
+    """One synthetic leaf photo: noisy background, elliptical leaf, brown lesions"""
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    image = rng.normal(90, 25, (height, width, 3)).astype(np.float32)
+    image[..., 1] += 20  # greenish soil / background
+
+    # Leaf: rotated ellipse with a vertical shading gradient
+    cx, cy = width * rng.uniform(0.4, 0.6), height * rng.uniform(0.4, 0.6)
+    angle = rng.uniform(0, np.pi)
+    u = (xx - cx) * np.cos(angle) + (yy - cy) * np.sin(angle)
+    v = -(xx - cx) * np.sin(angle) + (yy - cy) * np.cos(angle)
+    leaf = (u / (width * 0.38)) ** 2 + (v / (height * 0.22)) ** 2 < 1
+    shade = 0.8 + 0.4 * (yy / height)
+    green = np.stack([30 * shade, 130 * shade, 35 * shade], axis=-1)
+    image[leaf] = green[leaf] + rng.normal(0, 8, (leaf.sum(), 3))
+
+    # Disease spots inside the leaf
+    for _ in range(rng.integers(0, 12)):
+        sx, sy = rng.uniform(0, width), rng.uniform(0, height)
+        radius = rng.uniform(0.01, 0.05) * min(width, height)
+        spot = leaf & ((xx - sx) ** 2 + (yy - sy) ** 2 < radius ** 2)
+        image[spot] = (120, 70, 25)
+
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_corpus(num_images: int, seed: int = 0,
+                sizes: Tuple[Tuple[int, int], ...] = ((640, 480), (1024, 768), (1600, 1200))) -> List[bytes]:
+    """Deterministic set of JPEG-encoded synthetic leaves in typical upload sizes"""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(num_images):
+        array = make_leaf_image(rng, sizes[i % len(sizes)])
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, format='JPEG', quality=90)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+# ============================================================================
+# MEASUREMENT (runs inside the per-backend subprocess)
+# ============================================================================
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds"""
+    values = np.asarray(seconds) * 1000
+    return {
+        'count': len(values),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max())
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def set_threads(ai, threads: int, args):
+    """Resize the intra-op thread pool used by the backend"""
+    import torch
+    torch.set_num_threads(threads)
+    if ai.inference_backend == 'onnxruntime':
+        # ONNX Runtime sizes its own pool when the session is created
+        from model_export import OnnxRuntimeModel, default_artifact_path
+        ai.model = OnnxRuntimeModel(args.artifact or default_artifact_path(args.model, 'onnxruntime'),
+                                    num_threads=threads)
+
+
+def run_backend(args) -> Dict:
+    """Benchmark one backend in this process"""
+    import_start = time.perf_counter()
+    from ai_engine import KropScanAI
+    import_seconds = time.perf_counter() - import_start
+
+    corpus = make_corpus(args.images, seed=args.seed)
+
+    load_start = time.perf_counter()
     ai = KropScanAI(
-        model_path='kropscan_production_model.pth',
-        config_path='model_info.json',
-        use_tta=True,
-        tta_size=5
+        model_path=args.model,
+        config_path=args.config,
+        use_tta=args.tta,
+        cache_size=0,  # measure the model, not the cache
+        near_duplicate_distance=None,
+        inference_backend=args.backend,
+        artifact_path=args.artifact
     )
-    
-    if not ai.model_loaded:
-        print("❌ Model not loaded. Please run training first.")
-        return
-    
-    print(f"✅ Model loaded: {ai.config['model_architecture']}")
-    print(f"✅ Input size: {ai.input_size}x{ai.input_size}")
-    print(f"✅ Classes: {ai.num_classes}")
-    
-    # Create test image
-    test_image = create_test_image((ai.input_size, ai.input_size))
-    
-    # Convert to bytes for testing
-    img_byte_arr = io.BytesIO()
-    test_image.save(img_byte_arr, format='JPEG')
-    img_byte_arr = img_byte_arr.getvalue()
-    
-    print(f"\n📊 Starting benchmarks...")
-    
-    # Benchmark 1: Single prediction speed
-    print("\n⏱️ BENCHMARK 1: Single Prediction Speed")
-    times = []
-    for i in range(10):
-        start_time = time.time()
-        result = ai.predict(img_byte_arr)
-        end_time = time.time()
-        prediction_time = end_time - start_time
-        times.append(prediction_time)
-        print(f"   Run {i+1}: {prediction_time:.3f}s - {result[0]} (confidence: {result[1]:.3f})")
-    
-    avg_time = np.mean(times)
-    std_time = np.std(times)
-    print(f"   Average: {avg_time:.3f}s ± {std_time:.3f}s")
-    print(f"   Speed: {1/avg_time:.2f} predictions/second")
-    
-    # Benchmark 2: Memory usage
-    print("\n💾 BENCHMARK 2: Memory Usage")
-    if torch.cuda.is_available():
-        initial_memory = torch.cuda.memory_allocated()
-        print(f"   Initial GPU memory: {initial_memory / 1024**2:.1f} MB")
-        
-        # Run a few predictions
-        for _ in range(5):
-            ai.predict(img_byte_arr)
-        
-        peak_memory = torch.cuda.max_memory_allocated()
-        current_memory = torch.cuda.memory_allocated()
-        print(f"   Peak GPU memory: {peak_memory / 1024**2:.1f} MB")
-        print(f"   Current GPU memory: {current_memory / 1024**2:.1f} MB")
-        print(f"   Memory used by model: {(peak_memory - initial_memory) / 1024**2:.1f} MB")
-    
-    # Benchmark 3: Accuracy consistency
-    print("\n🎯 BENCHMARK 3: Prediction Consistency")
-    predictions = []
-    confidences = []
-    
-    for i in range(10):
-        result = ai.predict(img_byte_arr)
-        predictions.append(result[0])
-        confidences.append(result[1])
-        print(f"   Run {i+1}: {result[0]} (confidence: {result[1]:.3f})")
-    
-    # Analyze consistency
-    unique_predictions = list(set(predictions))
-    consistency = predictions.count(predictions[0]) / len(predictions)
-    avg_confidence = np.mean(confidences)
-    std_confidence = np.std(confidences)
-    
-    print(f"   Consistency: {consistency:.2f}")
-    print(f"   Unique predictions: {len(unique_predictions)}")
-    print(f"   Average confidence: {avg_confidence:.3f} ± {std_confidence:.3f}")
-    
-    # Benchmark 4: TTA effectiveness
-    print("\n🔍 BENCHMARK 4: TTA Effectiveness")
-    # Test with TTA
-    ai_with_tta = KropScanAI(use_tta=True)
-    ai_without_tta = KropScanAI(use_tta=False)
-    
-    if ai_with_tta.model_loaded and ai_without_tta.model_loaded:
-        # Run same image with and without TTA
-        start_time = time.time()
-        result_with_tta = ai_with_tta.predict(img_byte_arr)
-        time_with_tta = time.time() - start_time
-        
-        start_time = time.time()
-        result_without_tta = ai_without_tta.predict(img_byte_arr)
-        time_without_tta = time.time() - start_time
-        
-        print(f"   With TTA: {result_with_tta[0]} (confidence: {result_with_tta[1]:.3f}) in {time_with_tta:.3f}s")
-        print(f"   Without TTA: {result_without_tta[0]} (confidence: {result_without_tta[1]:.3f}) in {time_without_tta:.3f}s")
-        print(f"   TTA Speed Factor: {time_with_tta/time_without_tta:.2f}x slower")
-        print(f"   Confidence Difference: {abs(result_with_tta[1] - result_without_tta[1]):.3f}")
-    
+    if not ai.load():
+        raise RuntimeError(f"{args.backend} model failed to load")
+    load_seconds = time.perf_counter() - load_start
+
+    first_start = time.perf_counter()
+    ai.predict(corpus[0])
+    first_seconds = time.perf_counter() - first_start
+
+    result = {
+        'backend': args.backend,
+        'model_version': ai.model_version,
+        'cold_start': {
+            'import_s': import_seconds,
+            'load_s': load_seconds,
+            'first_prediction_s': first_seconds,
+            'total_s': time.perf_counter() - PROCESS_START
+        }
+    }
+
+    # Warm up, then reset stage histograms so they only cover measured runs
+    for image_bytes in corpus[:args.warmup]:
+        ai.predict(image_bytes)
+    ai.timer.reset()
+
+    # Single-image latency
+    latencies = []
+    for i in range(args.iterations):
+        start = time.perf_counter()
+        ai.predict(corpus[i % len(corpus)])
+        latencies.append(time.perf_counter() - start)
+    result['latency'] = summarize(latencies)
+
+    # Throughput grid: threads x batch size
+    throughput = {}
+    for threads in args.threads:
+        set_threads(ai, threads, args)
+        for batch_size in args.batch_sizes:
+            batch = [corpus[i % len(corpus)] for i in range(batch_size)]
+            ai.predict_batch(batch)  # warm this shape
+            batch_times = []
+            deadline = time.perf_counter() + args.min_seconds
+            while len(batch_times) < args.min_batches or time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ai.predict_batch(batch)
+                batch_times.append(time.perf_counter() - start)
+            throughput[f"threads={threads},batch={batch_size}"] = {
+                'threads': threads,
+                'batch_size': batch_size,
+                'images_per_s': batch_size * len(batch_times) / sum(batch_times),
+                'batch_latency': summarize(batch_times)
+            }
+            print(f"+ {args.backend}: {threads} threads, batch {batch_size}: "
+                  f"{throughput[f'threads={threads},batch={batch_size}']['images_per_s']:.1f} img/s",
+                  file=sys.stderr)
+    result['throughput'] = throughput
+    result['stages'] = ai.get_stats()['stages']
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+# ============================================================================
+# ORCHESTRATION
+# ============================================================================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict:
+    info = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def worker_command(args, backend: str) -> List[str]:
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker', '--backend', backend,
+        '--model', args.model, '--config', args.config,
+        '--images', str(args.images), '--seed', str(args.seed),
+        '--iterations', str(args.iterations), '--warmup', str(args.warmup),
+        '--min-batches', str(args.min_batches), '--min-seconds', str(args.min_seconds),
+        '--batch-sizes', *map(str, args.batch_sizes), '--threads', *map(str, args.threads)
+    ]
+    if args.tta:
+        command.append('--tta')
+    if args.artifact:
+        command += ['--artifact', args.artifact]
+    return command
+
+
+def run_suite(args) -> Dict:
+    """Run every requested backend in its own subprocess"""
+    report = {
+        'environment': environment(),
+        'settings': {
+            'images': args.images, 'seed': args.seed, 'tta': args.tta,
+            'iterations': args.iterations, 'batch_sizes': args.batch_sizes,
+            'threads': args.threads
+        },
+        'backends': {}
+    }
+
+    for backend in args.backends:
+        print(f"\n+ Benchmarking {backend}...")
+        completed = subprocess.run(worker_command(args, backend), stdout=subprocess.PIPE, text=True)
+        # The worker prints engine banners; its result is the last stdout line
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            print(f"- {backend}: skipped (exit code {completed.returncode})")
+            report['backends'][backend] = {'error': f"exit code {completed.returncode}"}
+            continue
+        report['backends'][backend] = json.loads(lines[-1])
+        print_backend(report['backends'][backend])
+
+    return report
+
+
+def print_backend(result: Dict):
+    cold = result['cold_start']
+    latency = result['latency']
+    print(f"+ {result['backend']}: cold start {cold['total_s']:.2f}s "
+          f"(import {cold['import_s']:.2f}s, load {cold['load_s']:.2f}s, "
+          f"first {cold['first_prediction_s'] * 1000:.0f} ms)")
+    print(f"  latency p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms")
+    best = max(result['throughput'].values(), key=lambda t: t['images_per_s'])
+    print(f"  best throughput {best['images_per_s']:.1f} img/s "
+          f"(batch {best['batch_size']}, {best['threads']} threads)")
+    if result.get('peak_rss_mb'):
+        print(f"  peak RSS {result['peak_rss_mb']:.0f} MB")
+
+
+# ============================================================================
+# COMPARISON
+# ============================================================================
+
+def key_metrics(report: Dict) -> Dict[str, Tuple[float, bool]]:
+    """Flatten a report into {metric: (value, higher_is_better)}"""
+    metrics = {}
+    for backend, result in report['backends'].items():
+        if 'error' in result:
+            continue
+        metrics[f"{backend}.cold_start_s"] = (result['cold_start']['total_s'], False)
+        metrics[f"{backend}.latency_p50_ms"] = (result['latency']['p50_ms'], False)
+        metrics[f"{backend}.latency_p95_ms"] = (result['latency']['p95_ms'], False)
+        for name, entry in result['throughput'].items():
+            metrics[f"{backend}.{name}.images_per_s"] = (entry['images_per_s'], True)
+        if result.get('peak_rss_mb'):
+            metrics[f"{backend}.peak_rss_mb"] = (result['peak_rss_mb'], False)
+    return metrics
+
+
+def compare_reports(baseline: Dict, current: Dict, tolerance: float = 0.10) -> List[str]:
+    """
+    Print metric deltas between two reports.
+
+    Args:
+        baseline: Earlier report (e.g. from the main branch)
+        current: Report from this run
+        tolerance: Relative change treated as noise
+
+    Returns:
+        Names of metrics that regressed by more than the tolerance
+    """
+    before, after = key_metrics(baseline), key_metrics(current)
+    regressions = []
+
     print("\n" + "="*80)
-    print("✅ BENCHMARK COMPLETE")
+    print(f"COMPARISON: {baseline['environment'].get('commit')} -> {current['environment'].get('commit')}")
     print("="*80)
-    
-    # Summary
-    print(f"\n📋 ENHANCED MODEL SUMMARY:")
-    print(f"   • Architecture: {ai.config['model_architecture']}")
-    print(f"   • Input Resolution: {ai.input_size}x{ai.input_size}")
-    print(f"   • Average Speed: {1/avg_time:.2f} predictions/second")
-    print(f"   • Average Confidence: {avg_confidence:.3f}")
-    print(f"   • Consistency: {consistency:.2f}")
-    print(f"   • TTA Augmentations: {len(ai.tta_augmenter.augmentations)}")
-    
-    if torch.cuda.is_available():
-        print(f"   • Peak GPU Memory: {peak_memory / 1024**2:.1f} MB")
+    for name in sorted(before.keys() & after.keys()):
+        old, higher_is_better = before[name]
+        new, _ = after[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  <-- REGRESSION"
+            regressions.append(name)
+        elif worse < -tolerance:
+            flag = "  (improved)"
+        print(f"{name:55s} {old:10.2f} -> {new:10.2f} ({change:+.1%}){flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="KropScan inference benchmark")
+    parser.add_argument('--model', default='kropscan_production_model.pth', help='Trained weights (.pth)')
+    parser.add_argument('--config', default='model_info.json', help='Model configuration')
+    parser.add_argument('--artifact', default=None, help='Exported model for non-eager backends')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--tta', action='store_true', help='Benchmark with test-time augmentation')
+    parser.add_argument('--images', type=int, default=32, help='Synthetic corpus size')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed')
+    parser.add_argument('--iterations', type=int, default=50, help='Single-image latency samples')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed predictions before measuring')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help='torch intra-op thread counts')
+    parser.add_argument('--min-batches', type=int, default=3, help='Minimum timed batches per cell')
+    parser.add_argument('--min-seconds', type=float, default=2.0, help='Minimum seconds per cell')
+    parser.add_argument('--output', default=None, help='Write the JSON report here')
+    parser.add_argument('--compare', default=None, help='Baseline JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Relative change flagged as regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--backend', default='eager', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    if args.worker:
+        result = run_backend(args)
+        print(json.dumps(result))
+        return
+
+    print("="*80)
+    print("KROPSCAN INFERENCE BENCHMARK")
+    print("="*80)
+    report = run_suite(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n+ Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print(f"\n- {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n+ No regressions")
+
 
 if __name__ == "__main__":
-    benchmark_model()
\ No newline at end of file
+    main()
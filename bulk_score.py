@@ -0,0 +1,297 @@
+# bulk_score.py - Score whole directories of field photos with the KropScan AI engine
+"""
+Walks an image directory tree (e.g. an SD card from an extension officer),
+scores every photo and streams one result per image to JSONL or CSV.
+
+- The tree is walked lazily in a fixed (sorted) order, so memory stays flat
+  however many photos there are
+- Images are read and decoded on a thread pool, a few batches ahead of the
+  model, while the main thread runs batched inference
+- After every batch the output is flushed and a checkpoint records how far
+  the run got; --resume continues from there after a crash or Ctrl+C
+
+Usage:
+    python bulk_score.py /media/sdcard --output results.jsonl
+    python bulk_score.py /media/sdcard --output results.csv --crop Tomato --resume
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from ai_engine import IMAGE_EXTENSIONS
+
+CSV_FIELDS = ('path', 'crop', 'disease', 'confidence', 'calibrated_confidence', 'uncertainty',
+              'confidence_level', 'requires_expert_review', 'top_k', 'treatment', 'error')
+
+
+# ============================================================================
+# INPUT
+# ============================================================================
+
+def walk_images(root: str) -> Iterator[str]:
+    """
+    Yield image paths under `root` depth-first in sorted order, one directory
+    listing at a time. The order is stable across runs, which is what makes
+    resuming by position possible.
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"- Skipping {root}: {e}")
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_images(entry.path)
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path
+
+
+def load_tensor(ai, path: str):
+    """Read and preprocess one image (runs on the decode pool)"""
+    with open(path, 'rb') as f:
+        return ai.preprocess(f.read())
+
+
+# ============================================================================
+# OUTPUT
+# ============================================================================
+
+def result_row(path: str, crop: Optional[str], report=None, error: Optional[str] = None,
+               with_treatment: bool = False) -> Dict[str, Any]:
+    """Flatten an AnalysisReport into one output record"""
+    row = {'path': path, 'crop': crop}
+    if report is not None and report.primary_prediction.class_name == "Processing Error":
+        error, report = report.recommendation, None
+
+    if report is None:
+        row.update(disease=None, confidence=None, calibrated_confidence=None, uncertainty=None,
+                   confidence_level=None, requires_expert_review=True, top_k=[], error=error)
+    else:
+        primary = report.primary_prediction
+        row.update(
+            disease=primary.class_name,
+            confidence=round(primary.confidence, 6),
+            calibrated_confidence=round(primary.calibrated_confidence, 6),
+            uncertainty=round(primary.uncertainty, 6),
+            confidence_level=report.confidence_level,
+            requires_expert_review=report.requires_expert_review,
+            top_k=[{'disease': p.class_name, 'confidence': round(p.calibrated_confidence, 6)}
+                   for p in report.top_k_predictions],
+            error=None
+        )
+    if with_treatment:
+        row['treatment'] = report.recommendation if report is not None else None
+    return row
+
+
+class JsonlWriter:
+    """One JSON object per line"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row: Dict[str, Any]):
+        self.f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+class CsvWriter:
+    """CSV with top-k flattened to 'disease:confidence;...'"""
+
+    def __init__(self, f, fields=CSV_FIELDS):
+        self.writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        if f.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, row: Dict[str, Any]):
+        row = dict(row, top_k=';'.join(f"{p['disease']}:{p['confidence']}" for p in row['top_k']))
+        self.writer.writerow(row)
+
+
+def open_writer(f, path: str, fmt: Optional[str], with_treatment: bool):
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    if fmt == 'csv':
+        fields = CSV_FIELDS if with_treatment else tuple(name for name in CSV_FIELDS if name != 'treatment')
+        return CsvWriter(f, fields)
+    return JsonlWriter(f)
+
+
+# ============================================================================
+# CHECKPOINTS
+# ============================================================================
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]):
+    """Atomically replace the checkpoint so a crash never leaves half a file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ============================================================================
+# SCORING
+# ============================================================================
+
+def score_paths(ai, paths: Iterator[str], crop: Optional[str] = None, batch_size: int = 32,
+                workers: Optional[int] = None, prefetch: int = 2) -> Iterator[List[tuple]]:
+    """
+    Score images in batches, decoding up to `prefetch` batches ahead on a
+    thread pool while the current batch runs through the model.
+
+    Yields:
+        One list per batch of (path, report, error) tuples, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    in_flight = batch_size * max(1, prefetch)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-decode") as pool:
+        while True:
+            # Keep the decode pool topped up; only `in_flight` tensors live at once
+            for path in itertools.islice(paths, in_flight - len(pending)):
+                pending.append((path, pool.submit(load_tensor, ai, path)))
+            if not pending:
+                return
+
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            decoded, results = [], []
+            for path, future in batch:
+                try:
+                    decoded.append((path, future.result()))
+                except Exception as e:
+                    results.append((path, None, f"{type(e).__name__}: {e}"))
+
+            if decoded:
+                reports = ai.analyze_tensors([tensor for _, tensor in decoded], crop)
+                results.extend((path, report, None) for (path, _), report in zip(decoded, reports))
+
+            order = {path: i for i, (path, _) in enumerate(batch)}
+            results.sort(key=lambda item: order[item[0]])
+            yield results
+
+
+def run(args, parser: Optional[argparse.ArgumentParser] = None) -> int:
+    from ai_engine import KropScanAI
+
+    engine_kwargs = {'use_tta': args.tta, 'inference_backend': args.backend, 'timing': False}
+    if args.model:
+        engine_kwargs['model_path'] = args.model
+    if args.config:
+        engine_kwargs['config_path'] = args.config
+    ai = KropScanAI(**engine_kwargs)
+    if not getattr(ai, 'model_loaded', False):
+        print("- Model could not be loaded; refusing to write mock results")
+        return 1
+    # Before touching the checkpoint, so a mistyped crop can't discard it
+    try:
+        crop = ai.resolve_crop(args.crop)
+    except ValueError as e:
+        if parser is not None:
+            parser.error(str(e))
+        print(f"- {e}")
+        return 2
+
+    checkpoint_path = args.checkpoint or args.output + '.checkpoint.json'
+    root = os.path.abspath(args.input)
+    state = {'root': root, 'output': os.path.abspath(args.output), 'processed': 0,
+             'last_path': None, 'output_offset': 0}
+
+    if args.resume:
+        saved = load_checkpoint(checkpoint_path)
+        if saved is not None:
+            if saved.get('root') != root:
+                print(f"- Checkpoint is for {saved.get('root')}, not {root}")
+                return 2
+            state = saved
+            print(f"+ Resuming after {state['processed']} images ({state['last_path']})")
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    paths = walk_images(root)
+    if state['processed']:
+        # The walk order is stable, so the first `processed` paths are the ones
+        # already written; make sure the tree hasn't changed underneath us
+        skipped = list(itertools.islice(paths, state['processed'] - 1, state['processed']))
+        if not skipped or skipped[0] != state['last_path']:
+            print("- Directory contents changed since the checkpoint; rerun without --resume")
+            return 2
+
+    mode = 'r+' if state['output_offset'] else 'w'
+    start = time.perf_counter()
+    scored = 0
+    with open(args.output, mode, newline='', encoding='utf-8') as f:
+        # Drop anything written after the last checkpoint (e.g. a partial batch)
+        f.seek(state['output_offset'])
+        f.truncate()
+        writer = open_writer(f, args.output, args.format, args.with_treatment)
+
+        try:
+            for batch in score_paths(ai, paths, crop, args.batch_size, args.workers, args.prefetch):
+                for path, report, error in batch:
+                    writer.write(result_row(os.path.relpath(path, root), crop, report, error,
+                                            args.with_treatment))
+                f.flush()
+                os.fsync(f.fileno())
+
+                scored += len(batch)
+                state.update(processed=state['processed'] + len(batch), last_path=batch[-1][0],
+                             output_offset=f.tell())
+                save_checkpoint(checkpoint_path, state)
+
+                elapsed = time.perf_counter() - start
+                print(f"+ {state['processed']} images scored ({scored / elapsed:.1f} img/s)")
+        except KeyboardInterrupt:
+            print(f"\n! Interrupted - rerun with --resume to continue from image {state['processed']}")
+            return 130
+
+    elapsed = time.perf_counter() - start
+    print(f"\n+ Done: {scored} images in {elapsed:.1f}s -> {args.output}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Score every image under a directory with KropScan")
+    parser.add_argument('input', help='Directory of images (searched recursively)')
+    parser.add_argument('--output', required=True, help='Results file (.jsonl or .csv)')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                        help='Output format (default: from the output extension)')
+    parser.add_argument('--crop', default=None, help='Restrict predictions to one crop')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass')
+    parser.add_argument('--workers', type=int, default=None, help='Decode threads (default: CPU count)')
+    parser.add_argument('--prefetch', type=int, default=2, help='Batches decoded ahead of the model')
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--with-treatment', action='store_true', help='Include treatment text per image')
+    parser.add_argument('--backend', default='eager', help='Inference backend (eager, torchscript, onnxruntime, quantized)')
+    parser.add_argument('--tta', action='store_true', help='Enable test-time augmentation')
+    parser.add_argument('--model', default=None, help='Model weights (default: engine default)')
+    parser.add_argument('--config', default=None, help='Model configuration (default: engine default)')
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def main():
+    parser = build_parser()
+    sys.exit(run(parser.parse_args(), parser))
+
+
+if __name__ == "__main__":
+    main()
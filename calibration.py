@@ -0,0 +1,125 @@
+"""
+Confidence Calibration for KropScan
+Fits a softmax temperature on the validation split (temperature scaling)
+"""
+import argparse
+import json
+import os
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+
+
+def fit_temperature(logits: torch.Tensor, labels: torch.Tensor, max_iter: int = 200) -> float:
+    """
+    Find the temperature T minimising the NLL of softmax(logits / T).
+
+    Args:
+        logits: (N, num_classes) validation logits
+        labels: (N,) true class indices
+
+    Returns:
+        Fitted temperature (> 0)
+    """
+    logits = logits.detach().float()
+    labels = labels.detach().long()
+
+    # Optimize log T so the temperature stays positive
+    log_t = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.exp().item())
+
+
+def expected_calibration_error(probabilities: torch.Tensor, labels: torch.Tensor, bins: int = 15) -> float:
+    """ECE: mean |accuracy - confidence| gap across confidence bins"""
+    confidences, predicted = probabilities.max(dim=1)
+    correct = (predicted == labels).float()
+    edges = torch.linspace(0, 1, bins + 1)
+
+    ece = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidences > low) & (confidences <= high)
+        if in_bin.any():
+            gap = (correct[in_bin].mean() - confidences[in_bin].mean()).abs()
+            ece += gap.item() * in_bin.float().mean().item()
+    return ece
+
+
+def collect_logits(model, config: dict, val_dir: str, max_images: Optional[int] = None,
+                   batch_size: int = 32, device: str = 'cpu'):
+    """Run the model over an ImageFolder split and return (logits, labels)"""
+    from model_quantization import list_images
+    from ai_engine import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor.from_config(config)
+    class_index = {name: i for i, name in enumerate(config['class_names'])}
+
+    samples = []
+    for class_name in sorted(os.listdir(val_dir)):
+        if class_name in class_index:
+            samples.extend((path, class_index[class_name])
+                           for path in list_images(os.path.join(val_dir, class_name)))
+    if max_images:
+        step = max(1, len(samples) // max_images)
+        samples = samples[::step][:max_images]
+
+    all_logits, all_labels = [], []
+    model.eval()
+    with torch.no_grad():
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start:start + batch_size]
+            batch = []
+            for path, _ in chunk:
+                with open(path, 'rb') as f:
+                    batch.append(preprocessor(f.read()))
+            all_logits.append(model(torch.stack(batch).to(device)).cpu())
+            all_labels.append(torch.tensor([label for _, label in chunk]))
+
+    return torch.cat(all_logits), torch.cat(all_labels)
+
+
+def calibrate_model_info(model, config_path: str, val_dir: str, max_images: Optional[int] = None,
+                         device: str = 'cpu') -> float:
+    """Fit the temperature for a model and store it in its model_info.json"""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+
+    logits, labels = collect_logits(model, config, val_dir, max_images, device=device)
+    temperature = fit_temperature(logits, labels)
+
+    before = expected_calibration_error(F.softmax(logits, dim=1), labels)
+    after = expected_calibration_error(F.softmax(logits / temperature, dim=1), labels)
+    print(f"+ Temperature: {temperature:.3f} (ECE {before:.4f} -> {after:.4f})")
+
+    config['temperature'] = temperature
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    return temperature
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit softmax temperature on the validation split")
+    parser.add_argument('--model', default='kropscan_production_model.pth', help='Trained weights (.pth)')
+    parser.add_argument('--config', default='model_info.json', help='Model configuration to update')
+    parser.add_argument('--val-dir', default=None, help='Validation split (default: same as train_enhanced.py)')
+    parser.add_argument('--max-images', type=int, default=0, help='Limit validation images (0 = all)')
+    args = parser.parse_args()
+
+    from model_export import load_eager_model
+    from model_quantization import default_val_dir
+
+    model, _ = load_eager_model(args.model, args.config)
+    calibrate_model_info(model, args.config, args.val_dir or default_val_dir(), args.max_images or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,10 @@ import json
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
-from user_management import UserManagement
+from metrics import REGISTRY
+from user_management import STORAGE_WRITE_ERRORS, STORAGE_WRITE_SECONDS, UserManagement
+
+CHAT_MESSAGES = REGISTRY.counter('kropscan_chat_messages_total', 'Messages posted to the universal chat')
 
 class CommunityChat:
     """Manages universal chat features for farmer discussions"""
@@ -72,9 +75,10 @@ class CommunityChat:
     def save_chat_data(self):
         """Save community chat data to file"""
         try:
-            with open(self.chat_file, 'w') as f:
+            with STORAGE_WRITE_SECONDS.labels('community_chat').time(), open(self.chat_file, 'w') as f:
                 json.dump(self.chat_data, f, indent=2)
         except Exception as e:
+            STORAGE_WRITE_ERRORS.labels('community_chat').inc()
             print(f"Error saving chat data: {e}")
 
     def get_universal_chat(self) -> Dict:
@@ -108,6 +112,7 @@ class CommunityChat:
 
         universal_chat['messages'].append(message_obj)
         self.save_chat_data()
+        CHAT_MESSAGES.inc()
         return True
 
     def get_messages(self, limit: int = 50) -> List[Dict]:
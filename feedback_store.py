@@ -0,0 +1,131 @@
+"""
+Feedback Store for KropScan
+Persists low-confidence uploads for expert review, off the request path
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+# Magic bytes -> file extension for stored images
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'RIFF', '.webp'),
+)
+
+# Same series as the JSON stores (user_management.py), labelled 'feedback'
+STORAGE_WRITE_SECONDS = REGISTRY.histogram(
+    'kropscan_storage_write_seconds', 'Time to persist one store write', ('store',))
+STORAGE_WRITE_ERRORS = REGISTRY.counter(
+    'kropscan_storage_write_errors_total', 'Failed store writes', ('store',))
+
+
+def image_extension(image_bytes: bytes) -> str:
+    """Guess a file extension from the image header"""
+    for signature, extension in _IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return extension
+    return '.bin'
+
+
+class FeedbackStore:
+    """
+    Content-addressed store of images that need expert review.
+
+    Each image is written once as `<sha256><ext>` under the store directory, so
+    re-uploads of the same photo never duplicate files and concurrent uploads
+    with the same filename never collide. Every review case is appended as one
+    JSON line to a sidecar `index.jsonl`. Writes run on a single background
+    thread, so request handlers only pay for hashing.
+    """
+
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, root: str = "database/feedback"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, self.INDEX_FILE)
+        self._index_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feedback-writer")
+
+    def save_async(self, image_bytes: bytes, metadata: Optional[Dict] = None) -> str:
+        """
+        Queue an image for persistence and return its case id immediately.
+
+        Args:
+            image_bytes: Uploaded image
+            metadata: Extra fields for the index (disease, confidence, filename...)
+
+        Returns:
+            Case id (first 12 hex characters of the content hash)
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        case_id = digest[:12]
+        record = {
+            'case_id': case_id,
+            'sha256': digest,
+            'file': digest + image_extension(image_bytes),
+            'size': len(image_bytes),
+            'received_at': datetime.now().isoformat(),
+            **(metadata or {})
+        }
+        future = self._writer.submit(self._write, image_bytes, record)
+        future.add_done_callback(self._log_failure)
+        return case_id
+
+    def save(self, image_bytes: bytes, metadata: Optional[Dict] = None) -> str:
+        """Synchronous variant of save_async (waits for the write)"""
+        case_id = self.save_async(image_bytes, metadata)
+        self.flush()
+        return case_id
+
+    def _write(self, image_bytes: bytes, record: Dict):
+        with STORAGE_WRITE_SECONDS.labels('feedback').time():
+            self._write_case(image_bytes, record)
+
+    def _write_case(self, image_bytes: bytes, record: Dict):
+        path = os.path.join(self.root, record['file'])
+        if not os.path.exists(path):
+            # Write to a temp name first so readers never see a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+
+        with self._index_lock:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def _log_failure(future: Future):
+        error = future.exception()
+        if error is not None:
+            STORAGE_WRITE_ERRORS.labels('feedback').inc()
+            print(f"- Error saving feedback image: {error}")
+
+    def flush(self):
+        """Block until all queued writes have finished"""
+        self._writer.submit(lambda: None).result()
+
+    def get_cases(self, limit: Optional[int] = None) -> List[Dict]:
+        """Read review cases from the sidecar index (most recent last)"""
+        if not os.path.exists(self.index_path):
+            return []
+        with self._index_lock:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                cases = [json.loads(line) for line in f if line.strip()]
+        return cases[-limit:] if limit else cases
+
+    def image_path(self, case: Dict) -> str:
+        """Path of the stored image for an index record"""
+        return os.path.join(self.root, case['file'])
+
+    def close(self):
+        """Finish pending writes and stop the writer thread"""
+        self._writer.shutdown(wait=True)
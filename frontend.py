@@ -42,55 +42,53 @@ os.makedirs("database/users", exist_ok=True)
 
 @st.cache_resource
 def load_services():
-    """Load and cache all heavy services"""
-    services = {
-        'auth': None,
-        'chat': None,
-        'community': None,
-        'user_mgr': None,
-        'comm_feat': None,
-        'ai': None
-    }
-    
-    # 1. Authentication
-    try:
-        from auth_system import AuthSystem
-        services['auth'] = AuthSystem()
-        print("✅ Auth System loaded")
-    except Exception as e:
-        print(f"❌ Auth System failed: {e}")
+    """Load and cache all heavy services (one instance each, shared by every session)"""
+    from service_container import ServiceContainer, register_user_services
+    container = ServiceContainer()
 
-    # 2. AI Engine
-    try:
+    def build_ai():
         from ai_engine import KropScanAI
-        services['ai'] = KropScanAI()
-        print("✅ AI Engine loaded")
-    except Exception as e:
-        print(f"❌ AI Engine failed: {e}")
-
-    # 3. Chatbot
-    try:
+        # Reruns and re-uploads of the same photo are served from the prediction cache;
+        # weights load on the first scan so the app renders immediately
+        ai = KropScanAI(cache_path="database/prediction_cache.db", lazy_load=True,
+                        model_registry=os.getenv("KROPSCAN_MODEL_REGISTRY"))
+        # Cached resource is shared by all sessions, so concurrent scans batch together
+        ai.enable_micro_batching(max_batch_size=8, max_wait_ms=10)
+        # New registry versions are loaded in the background and swapped in
+        ai.watch_registry()
+        return ai
+
+    def build_chatbot():
         from chatbot import KropBot
-        services['chat'] = KropBot()
-        print("✅ Chatbot loaded")
-    except Exception as e:
-        print(f"❌ Chatbot failed: {e}")
+        return KropBot()
 
-    # 4. Community Features
-    try:
-        from community_chat import CommunityChat
-        from user_management import UserManagement
-        services['community'] = CommunityChat()
-        services['user_mgr'] = UserManagement()
-        print("✅ Community System loaded")
-    except Exception as e:
-        print(f"❌ Community System failed: {e}")
-        
-    try:
+    def build_community_features():
         from community_features import CommunityFeatures
-        services['comm_feat'] = CommunityFeatures()
-    except Exception:
-        pass
+        return CommunityFeatures()
+
+    container.register('ai', build_ai)
+    container.register('chatbot', build_chatbot)
+    container.register('community_features', build_community_features)
+    # Auth and community chat share one UserManagement (one users.json load)
+    register_user_services(container)
+
+    services = {}
+    for key, name, label in (
+        ('auth', 'auth_system', 'Auth System'),
+        ('ai', 'ai', 'AI Engine'),
+        ('chat', 'chatbot', 'Chatbot'),
+        ('community', 'community_chat', 'Community System'),
+        ('user_mgr', 'user_manager', 'User Management'),
+        ('comm_feat', 'community_features', None),
+    ):
+        try:
+            services[key] = container.get(name)
+            if label and services[key] is not None:
+                print(f"✅ {label} loaded")
+        except Exception as e:
+            services[key] = None
+            if label:
+                print(f"❌ {label} failed: {e}")
 
     return services
 
@@ -0,0 +1,154 @@
+"""
+Dynamic Micro-Batching for KropScan
+Gathers prediction requests that arrive within a short window into one batch
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    Collects single-image requests from many callers and runs them as one batch.
+
+    The first request to arrive opens a window of `max_wait_ms`; every request
+    that arrives before the window closes (up to `max_batch_size`) is sent to
+    `batch_fn` in the same call, and each caller gets its own result back.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        name: str = "kropscan-batcher"
+    ):
+        """
+        Args:
+            batch_fn: Function mapping a list of inputs to a list of results (same order)
+            max_batch_size: Maximum number of requests per batch
+            max_wait_ms: How long to hold the first request waiting for more
+            name: Name of the background worker thread
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._running = True
+        self._lock = threading.Lock()
+
+        # Counters for monitoring
+        self.batches_run = 0
+        self.items_processed = 0
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item and return a Future that resolves to its result"""
+        future = Future()
+        # Checked and queued under the lock, so nothing lands behind stop()'s sentinel
+        with self._lock:
+            if self._running:
+                self._queue.put((item, future))
+                return future
+        future.set_exception(RuntimeError("MicroBatcher has been stopped"))
+        return future
+
+    def predict(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking helper: submit one item and wait for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def stop(self):
+        """Stop the worker thread after draining requests already queued"""
+        with self._lock:
+            if self._running:
+                self._running = False
+                self._queue.put(None)
+        self._worker.join(timeout=5)
+
+        # Left behind by a worker that is stuck in a batch (or died): fail them
+        # rather than leave their callers waiting forever
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(RuntimeError("MicroBatcher has been stopped"))
+        if self._worker.is_alive():
+            self._queue.put(None)
+
+    def get_stats(self) -> dict:
+        """Return batching statistics"""
+        with self._lock:
+            avg = self.items_processed / self.batches_run if self.batches_run else 0.0
+            return {
+                'batches_run': self.batches_run,
+                'items_processed': self.items_processed,
+                'avg_batch_size': avg,
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0
+            }
+
+    def _collect_batch(self, first: Tuple[Any, Future]) -> List[Tuple[Any, Future]]:
+        """Gather requests until the window closes or the batch is full"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Stop signal - finish this batch, then exit
+                self._queue.put(None)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        """Worker loop"""
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                # The sentinel is always the last item queued: nothing is left
+                return
+
+            batch = self._collect_batch(entry)
+
+            # Skip requests whose callers already gave up
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(items)} inputs"
+                    )
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+
+            with self._lock:
+                self.batches_run += 1
+                self.items_processed += len(items)
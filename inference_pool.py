@@ -0,0 +1,252 @@
+"""
+Multi-Process Inference Pool for KropScan
+Runs KropScanAI in worker processes so forward passes never block the API
+"""
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when the pool already has max_pending requests in flight"""
+
+
+# Engine owned by the current worker process (set by _init_worker)
+_worker_engine = None
+
+
+def _init_worker(engine_kwargs: Dict, threads_per_worker: int, core_groups: List[List[int]], counter,
+                 timing_buffer=None, ready=None):
+    """Per-process initializer: pin cores, size the torch thread pool, load the model once"""
+    global _worker_engine
+
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    if core_groups and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, core_groups[index % len(core_groups)])
+        except OSError as e:
+            print(f"! Worker {index}: could not pin cores: {e}")
+
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set in this process
+        pass
+
+    if _worker_engine is not None:
+        # Forked from a preloaded parent: weights are already shared copy-on-write
+        _worker_engine.after_fork()
+    else:
+        from ai_engine import KropScanAI
+        _worker_engine = KropScanAI(**engine_kwargs)
+    _worker_engine.warmup()
+    # Each worker picks up newly activated registry versions on its own
+    _worker_engine.watch_registry()
+
+    if timing_buffer is not None and _worker_engine.timer.enabled:
+        # Record stage latencies into the histograms the parent reads
+        from ai_engine import StageTimer
+        _worker_engine.timer = StageTimer(buffer=timing_buffer)
+    if ready is not None and _worker_engine.warm:
+        # This worker's slot holds its pid while it is up; the parent also
+        # checks the pid is still alive, since a killed worker never clears it
+        slot = index % len(ready)
+        ready[slot] = os.getpid()
+        multiprocessing.util.Finalize(None, _clear_ready_slot, args=(ready, slot, os.getpid()), exitpriority=10)
+    print(f"+ Inference worker {index} ready (pid {os.getpid()}, {threads_per_worker} threads)")
+
+
+def _clear_ready_slot(ready, slot: int, pid: int):
+    with ready.get_lock():
+        if ready[slot] == pid:
+            ready[slot] = 0
+
+
+def _worker_predict(image_bytes: bytes, crop: Optional[str] = None) -> Tuple[str, float, str]:
+    return _worker_engine.predict(image_bytes, crop)
+
+
+def _worker_predict_batch(images: List[bytes], crop=None) -> List[Tuple[str, float, str]]:
+    return _worker_engine.predict_batch(images, crop)
+
+
+def _worker_analyze(image_bytes: bytes, crop: Optional[str] = None):
+    return _worker_engine.analyze(image_bytes, crop)
+
+
+def _worker_analyze_batch(images: List[bytes], crop=None):
+    return _worker_engine.analyze_batch(images, crop)
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    Pool of worker processes, each holding its own KropScanAI instance.
+
+    Available cores are split evenly between workers: each worker is pinned to
+    its share and runs torch with that many threads, so N workers together use
+    the whole box without oversubscribing it.
+
+    With `preload=True` the engine is built once in the parent and the workers
+    are forked from it, so all of them share the parent's weight pages
+    copy-on-write instead of each loading a private copy. Otherwise workers are
+    spawned and load the model themselves. At most `max_pending` requests
+    can be queued or running; beyond that submit() raises PoolSaturatedError
+    so callers can shed load (e.g. HTTP 503 + Retry-After).
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        max_pending: int = 64,
+        engine_kwargs: Optional[Dict[str, Any]] = None,
+        pin_cores: bool = True,
+        retry_after: int = 1,
+        preload: bool = False
+    ):
+        """
+        Args:
+            num_workers: Worker processes (default: one per 4 cores, at least 1)
+            max_pending: Maximum queued + running requests before rejecting
+            engine_kwargs: Keyword arguments for KropScanAI in each worker
+            pin_cores: Pin each worker to its own slice of CPU cores
+            retry_after: Seconds clients should wait after a rejection
+            preload: Load the model in this process and fork workers from it
+                (POSIX only; falls back to spawn elsewhere)
+        """
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        self.num_workers = num_workers or max(1, len(cores) // 4)
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+
+        threads_per_worker = max(1, len(cores) // self.num_workers)
+        core_groups = []
+        if pin_cores and len(cores) >= self.num_workers:
+            core_groups = [cores[i * threads_per_worker:(i + 1) * threads_per_worker]
+                           for i in range(self.num_workers)]
+
+        global _worker_engine
+        self.preload = preload and 'fork' in multiprocessing.get_all_start_methods()
+        if self.preload:
+            # Load (but never run) the model here: no forward pass has started
+            # torch's intra-op thread pool yet, so forking is safe
+            from ai_engine import KropScanAI
+            _worker_engine = KropScanAI(**(engine_kwargs or {}))
+            context = multiprocessing.get_context('fork')
+        else:
+            # spawn: torch's thread pools are not fork-safe once initialised
+            context = multiprocessing.get_context('spawn')
+
+        # Stage latency histograms in shared memory, written by every worker
+        from ai_engine import StageTimer
+        timing_buffer = StageTimer.create_shared_buffer(context)
+        self.timer = StageTimer(buffer=timing_buffer)
+        # pid of each worker that finished loading + warming its model (0 = none)
+        self._ready = context.Array('i', self.num_workers)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(engine_kwargs or {}, threads_per_worker, core_groups, context.Value('i', 0),
+                      timing_buffer, self._ready)
+        )
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+
+        print(f"+ Inference pool: {self.num_workers} workers x {threads_per_worker} threads, "
+              f"max {max_pending} pending ({'preload + fork' if self.preload else 'spawn'})")
+
+    def start(self):
+        """
+        Start every worker now instead of on the first requests, so the models
+        load and warm before traffic arrives (see ready_workers)
+        """
+        for _ in range(self.num_workers):
+            self._executor.submit(_worker_ping)
+
+    @property
+    def ready_workers(self) -> int:
+        """Live workers whose model is loaded and warm (0 once the pool is broken)"""
+        if getattr(self._executor, '_broken', False):
+            return 0
+        processes = getattr(self._executor, '_processes', None) or {}
+        live = {pid for pid, process in list(processes.items()) if process.is_alive()}
+        return sum(1 for pid in self._ready[:] if pid and pid in live)
+
+    def _submit(self, fn, *payload) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturatedError(f"Inference pool is full ({self.max_pending} pending requests)")
+
+        with self._lock:
+            self.pending += 1
+            self.submitted += 1
+
+        try:
+            future = self._executor.submit(fn, *payload)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def submit(self, image_bytes: bytes, crop: Optional[str] = None) -> Future:
+        """Queue one image; the Future resolves to (disease, confidence, treatment)"""
+        return self._submit(_worker_predict, image_bytes, crop)
+
+    def submit_analyze(self, image_bytes: bytes, crop: Optional[str] = None) -> Future:
+        """Queue one image; the Future resolves to an AnalysisReport"""
+        return self._submit(_worker_analyze, image_bytes, crop)
+
+    def submit_batch(self, images: List[bytes], crop=None) -> Future:
+        """Queue a list of images as one task; resolves to a list of results"""
+        return self._submit(_worker_predict_batch, list(images), crop)
+
+    def submit_analyze_batch(self, images: List[bytes], crop=None) -> Future:
+        """Queue a list of images as one task; resolves to a list of AnalysisReport"""
+        return self._submit(_worker_analyze_batch, list(images), crop)
+
+    def predict(self, image_bytes: bytes, crop: Optional[str] = None,
+                timeout: Optional[float] = None) -> Tuple[str, float, str]:
+        """Blocking helper around submit()"""
+        return self.submit(image_bytes, crop).result(timeout=timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue depth and admission counters"""
+        with self._lock:
+            return {
+                'workers': self.num_workers,
+                'ready_workers': self.ready_workers,
+                'preload': self.preload,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'stages': self.timer.get_stats()
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop all worker processes"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,385 @@
+# load_test.py - Load generator for the KropScan FastAPI backend
+"""
+Replays a weighted mix of /analyze, /chat, /auth/login and /chat/messages
+traffic against backend.py at increasing request rates. For every step it
+reports latency percentiles, error rates and achieved throughput, and it
+finds the saturation point: the first rate where p95 latency exceeds the
+SLO, errors exceed the budget, or the server stops keeping up.
+
+Requests are sent open-loop: they go out on schedule whether or not
+earlier ones have finished. Latency is measured from the scheduled send
+time, so a backed-up server shows up as latency instead of being hidden by
+a slower client.
+
+Targets:
+    (default)   in-process ASGI app via httpx, no network
+    --serve     local uvicorn process started by this script
+    --url URL   an already running server
+
+Engines (in-process / --serve):
+    mock         MockKropScanAI, optionally with --engine-latency-ms per image
+    mock_predict backend.mock_predict fallback (no engine at all)
+    real         KropScanAI as configured in backend.py (needs the model)
+
+Usage:
+    python load_test.py --rps 5 10 20 40 --duration 15
+    python load_test.py --serve --engine mock --engine-latency-ms 80 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from benchmark import make_corpus, summarize
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = ('analyze', 'chat', 'login', 'messages')
+DEFAULT_MIX = 'analyze=0.6,chat=0.2,login=0.1,messages=0.1'
+
+LOADTEST_USER = {
+    'name': 'Load Test Farmer',
+    'email': 'loadtest@kropscan.local',
+    'phone': '9000000000',
+    'password': 'loadtest-password',
+    'location': 'Pune',
+    'farm_size': '2.5'
+}
+
+CHAT_MESSAGES = [
+    "My tomato leaves have brown spots",
+    "How often should I water wheat?",
+    "Which fertilizer is best for potatoes?",
+    "Pests on my cotton crop",
+]
+
+
+# ============================================================================
+# BACKEND SETUP
+# ============================================================================
+
+def configure_backend(engine: str, engine_latency_ms: float = 0.0, real_chat: bool = False):
+    """
+    Import backend.py and swap its AI engine (and chatbot) for load testing
+
+    Returns:
+        The backend module (its `app` is the ASGI application)
+    """
+    sys.path.insert(0, REPO_DIR)
+    import backend
+
+    if engine == 'mock':
+        from ai_engine import MockKropScanAI
+
+        class LatencyMockKropScanAI(MockKropScanAI):
+            """Mock engine that spends a fixed time per image, like a real forward pass"""
+
+            def predict(self, image_bytes: bytes, crop=None):
+                if engine_latency_ms:
+                    time.sleep(engine_latency_ms / 1000)
+                return super().predict(image_bytes, crop)
+
+        backend.services.override('ai', LatencyMockKropScanAI())
+        backend.services.override('inference_pool', None)
+    elif engine == 'mock_predict':
+        backend.services.override('ai', None)
+        backend.services.override('inference_pool', None)
+
+    if not real_chat:
+        # The LLM chatbot calls an external API - keep it out of the measurement
+        backend.services.override('chatbot', None)
+    return backend
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir: str) -> Tuple[subprocess.Popen, str]:
+    """Run uvicorn in a child process (see --serve-child) and wait until it answers"""
+    import httpx
+
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--serve-child', '--port', str(port),
+               '--engine', args.engine, '--engine-latency-ms', str(args.engine_latency_ms)]
+    if args.real_chat:
+        command.append('--real-chat')
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    process = subprocess.Popen(command, cwd=workdir, env=env)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            httpx.get(url + "/healthz", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start within 120 s")
+
+
+def serve_child(args):
+    """Entry point of the --serve child: configure backend.py and run uvicorn"""
+    import uvicorn
+    backend = configure_backend(args.engine, args.engine_latency_ms, args.real_chat)
+    uvicorn.run(backend.app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+# ============================================================================
+# TRAFFIC
+# ============================================================================
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'analyze=0.6,chat=0.4' -> normalized weights"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items()}
+
+
+class TrafficGenerator:
+    """Builds requests for each endpoint and records their outcome"""
+
+    def __init__(self, client, images: List[bytes], seed: int = 0):
+        self.client = client
+        self.images = images
+        self.rng = random.Random(seed)
+
+    async def setup(self):
+        """Make sure the load-test user exists so logins succeed"""
+        await self.client.post("/auth/register", data=LOADTEST_USER)
+        response = await self.client.post("/auth/login", data={
+            'email': LOADTEST_USER['email'], 'password': LOADTEST_USER['password']
+        })
+        if response.json().get('status') != 'success':
+            print("! Load-test user cannot log in - /auth/login requests will count as errors")
+
+    def build(self, endpoint: str) -> Tuple[str, str, Dict]:
+        """(method, path, httpx kwargs) for one request"""
+        if endpoint == 'analyze':
+            image = self.rng.choice(self.images)
+            return 'POST', '/analyze', {'files': {'file': ('leaf.jpg', image, 'image/jpeg')}}
+        if endpoint == 'chat':
+            return 'POST', '/chat', {'data': {'message': self.rng.choice(CHAT_MESSAGES), 'language': 'en'}}
+        if endpoint == 'login':
+            return 'POST', '/auth/login', {'data': {
+                'email': LOADTEST_USER['email'], 'password': LOADTEST_USER['password']
+            }}
+        return 'GET', '/chat/messages', {'params': {'limit': 50}}
+
+    async def send(self, endpoint: str, scheduled: float, timeout: float) -> Dict:
+        method, path, kwargs = self.build(endpoint)
+        outcome = 'ok'
+        try:
+            response = await self.client.request(method, path, timeout=timeout, **kwargs)
+            if response.status_code >= 400:
+                outcome = f"http_{response.status_code}"
+            elif response.json().get('status') == 'error':
+                outcome = 'app_error'
+        except Exception as e:
+            outcome = type(e).__name__
+        return {
+            'endpoint': endpoint,
+            'outcome': outcome,
+            'latency': time.perf_counter() - scheduled
+        }
+
+
+async def run_step(generator: TrafficGenerator, mix: Dict[str, float], rps: float,
+                   duration: float, timeout: float) -> Dict:
+    """Send `rps` requests per second for `duration` seconds and summarize them"""
+    names, weights = list(mix), list(mix.values())
+    tasks = []
+    start = time.perf_counter()
+
+    for i in range(int(rps * duration)):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint = generator.rng.choices(names, weights)[0]
+        tasks.append(asyncio.create_task(generator.send(endpoint, scheduled, timeout)))
+
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    step = {
+        'target_rps': rps,
+        'requests': len(results),
+        'achieved_rps': len(results) / elapsed if elapsed else 0.0,
+        'error_rate': sum(r['outcome'] != 'ok' for r in results) / max(1, len(results)),
+        'outcomes': dict(Counter(r['outcome'] for r in results)),
+        'latency': summarize([r['latency'] for r in results]) if results else {},
+        'endpoints': {}
+    }
+    for endpoint in names:
+        subset = [r for r in results if r['endpoint'] == endpoint]
+        if subset:
+            step['endpoints'][endpoint] = {
+                'requests': len(subset),
+                'error_rate': sum(r['outcome'] != 'ok' for r in subset) / len(subset),
+                'latency': summarize([r['latency'] for r in subset])
+            }
+    return step
+
+
+def saturation_reason(step: Dict, slo_ms: float, max_error_rate: float) -> Optional[str]:
+    """Why a step counts as saturated (None if the server kept up)"""
+    if step['error_rate'] > max_error_rate:
+        return f"error rate {step['error_rate']:.1%} > {max_error_rate:.1%}"
+    if step['latency'] and step['latency']['p95_ms'] > slo_ms:
+        return f"p95 {step['latency']['p95_ms']:.0f} ms > SLO {slo_ms:.0f} ms"
+    if step['achieved_rps'] < 0.9 * step['target_rps']:
+        return f"achieved {step['achieved_rps']:.1f} of {step['target_rps']:.1f} req/s"
+    return None
+
+
+def print_step(step: Dict):
+    latency = step['latency']
+    print(f"+ {step['target_rps']:6.1f} req/s -> {step['achieved_rps']:6.1f} achieved | "
+          f"p50 {latency.get('p50_ms', 0):7.1f} ms  p95 {latency.get('p95_ms', 0):7.1f} ms  "
+          f"p99 {latency.get('p99_ms', 0):7.1f} ms | errors {step['error_rate']:.1%}")
+    for endpoint, stats in step['endpoints'].items():
+        print(f"    {endpoint:9s} {stats['requests']:5d} req  p95 {stats['latency']['p95_ms']:7.1f} ms  "
+              f"errors {stats['error_rate']:.1%}")
+
+
+async def run_load_test(client, args) -> Dict:
+    mix = parse_mix(args.mix)
+    images = make_corpus(args.images, seed=args.seed, sizes=((1024, 768), (1600, 1200)))
+    generator = TrafficGenerator(client, images, seed=args.seed)
+    await generator.setup()
+
+    report = {
+        'settings': {
+            'target': args.url or ('uvicorn' if args.serve else 'in-process'),
+            'engine': None if args.url else args.engine,
+            'engine_latency_ms': args.engine_latency_ms,
+            'mix': mix,
+            'duration_s': args.duration,
+            'slo_p95_ms': args.slo_ms,
+            'max_error_rate': args.max_error_rate
+        },
+        'steps': [],
+        'max_sustainable_rps': None,
+        'saturation': None
+    }
+
+    for rps in args.rps:
+        step = await run_step(generator, mix, rps, args.duration, args.timeout)
+        report['steps'].append(step)
+        print_step(step)
+
+        reason = saturation_reason(step, args.slo_ms, args.max_error_rate)
+        if reason:
+            report['saturation'] = {'rps': rps, 'reason': reason}
+            print(f"- Saturated at {rps:.1f} req/s: {reason}")
+            if not args.keep_going:
+                break
+        elif report['saturation'] is None:
+            report['max_sustainable_rps'] = rps
+
+    return report
+
+
+async def run_against(args, base_url: Optional[str]) -> Dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            return await run_load_test(client, args)
+
+    backend = configure_backend(args.engine, args.engine_latency_ms, args.real_chat)
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", limits=limits) as client:
+        return await run_load_test(client, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="KropScan backend load test")
+    parser.add_argument('--url', default=None, help='Test an already running server')
+    parser.add_argument('--serve', action='store_true', help='Start a local uvicorn server to test')
+    parser.add_argument('--engine', default='mock', choices=['mock', 'mock_predict', 'real'])
+    parser.add_argument('--engine-latency-ms', type=float, default=0.0,
+                        help='Simulated inference time per image for the mock engine')
+    parser.add_argument('--real-chat', action='store_true', help='Use the real chatbot (external API)')
+    parser.add_argument('--workdir', default=None,
+                        help='Working directory for the backend (default: a temp dir, or the repo for --engine real)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Traffic weights, e.g. analyze=0.6,chat=0.4')
+    parser.add_argument('--rps', type=float, nargs='+', default=[5, 10, 20, 40, 80], help='Request-rate steps')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per step')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout (s)')
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help='p95 latency objective')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Error-rate budget')
+    parser.add_argument('--max-connections', type=int, default=256, help='Client connection limit')
+    parser.add_argument('--keep-going', action='store_true', help='Run all steps even after saturation')
+    parser.add_argument('--images', type=int, default=8, help='Synthetic upload corpus size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write the JSON report here')
+    parser.add_argument('--serve-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=8000, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.serve_child:
+        serve_child(args)
+        return
+
+    print("="*80)
+    print("KROPSCAN BACKEND LOAD TEST")
+    print("="*80)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        # Keep users.json, chat history and review images out of the repo
+        workdir = args.workdir or (REPO_DIR if args.engine == 'real' else tempfile.mkdtemp(prefix='kropscan_load_'))
+        if args.serve:
+            server, base_url = start_server(args, workdir)
+        else:
+            os.chdir(workdir)
+        print(f"+ Backend working directory: {workdir}")
+
+    try:
+        report = asyncio.run(run_against(args, base_url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print("="*80)
+    if report['saturation']:
+        print(f"+ Max sustainable rate: {report['max_sustainable_rps'] or 0:.1f} req/s "
+              f"(saturated at {report['saturation']['rps']:.1f}: {report['saturation']['reason']})")
+    else:
+        print(f"+ No saturation up to {args.rps[-1]:.1f} req/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"+ Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Metrics Registry for KropScan
+In-process counters, gauges and histograms, rendered in the Prometheus text
+exposition format (0.0.4) by the backend's /metrics endpoint.
+
+Recording is a lock-protected add (histograms add a bisect over a handful of
+bucket bounds), so instrumentation can stay on in production. Values that
+already live elsewhere - the engine's stage histograms, cache counters, queue
+depths - are not recorded twice: a collector registered with
+register_collector() reads them when /metrics is scraped.
+
+Usage:
+    from metrics import REGISTRY
+    LOGINS = REGISTRY.counter('kropscan_auth_logins_total', 'Login attempts', ('result',))
+    LOGINS.labels('success').inc()
+
+    WRITE_SECONDS = REGISTRY.histogram('kropscan_storage_write_seconds', 'JSON store writes', ('store',))
+    with WRITE_SECONDS.labels('users').time():
+        ...
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; suits request handlers and small file writes
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+# ============================================================================
+# METRIC FAMILIES
+# ============================================================================
+
+class MetricFamily:
+    """
+    One metric's samples at scrape time. Registered metrics produce these,
+    and collectors build them from values kept elsewhere.
+    """
+
+    def __init__(self, name: str, kind: str, help: str):
+        """
+        Args:
+            name: Metric name (e.g. 'kropscan_cache_hits_total')
+            kind: 'counter', 'gauge' or 'histogram'
+            help: One-line description
+        """
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples: List[Tuple[str, Tuple[Tuple[str, str], ...], float]] = []
+
+    def add(self, value: float, **labels):
+        """Add a counter/gauge sample"""
+        self.samples.append((self.name, tuple(labels.items()), value))
+        return self
+
+    def add_histogram(self, buckets: Iterable[Tuple[float, float]], total: float, count: float, **labels):
+        """
+        Add a histogram series
+
+        Args:
+            buckets: (upper bound, cumulative count) pairs, ascending, without +Inf
+            total: Sum of all observations
+            count: Number of observations (the +Inf bucket)
+        """
+        base = tuple(labels.items())
+        for upper, cumulative in buckets:
+            self.samples.append((self.name + '_bucket', base + (('le', _format_value(upper)),), cumulative))
+        self.samples.append((self.name + '_bucket', base + (('le', '+Inf'),), count))
+        self.samples.append((self.name + '_sum', base, total))
+        self.samples.append((self.name + '_count', base, count))
+        return self
+
+    def render(self, lines: List[str]):
+        lines.append(f'# HELP {self.name} {self.help}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        for name, labels, value in self.samples:
+            lines.append(f'{name}{_label_text(labels)} {_format_value(value)}')
+
+
+# ============================================================================
+# RECORDED METRICS
+# ============================================================================
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+
+class _Timer:
+    """Context manager observing its duration into a histogram child"""
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _HistogramChild:
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above the largest bound
+        self.total = 0.0
+
+    def observe(self, value: float):
+        bucket = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.total += value
+
+    def time(self) -> _Timer:
+        """`with histogram.time(): ...` observes the block's duration in seconds"""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[Tuple[float, int]], float, int]:
+        with self._lock:
+            counts, total = list(self.counts), self.total
+        cumulative, buckets = 0, []
+        for upper, n in zip(self.bounds, counts):
+            cumulative += n
+            buckets.append((upper, cumulative))
+        return buckets, total, cumulative + counts[-1]
+
+
+class _Metric:
+    """Base for recorded metrics: a child per label combination"""
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._default = None if self.labelnames else self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """
+        Child series for one label combination (created on first use)
+
+        Hot paths can call this once and keep the child.
+        """
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _series(self):
+        with self._lock:
+            items = list(self._children.items())
+        for key, child in items:
+            yield dict(zip(self.labelnames, key)), child
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, self.kind, self.help)
+        for labels, child in self._series():
+            family.add(child.value, **labels)
+        return family
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """Distribution over fixed bucket bounds"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(float(b) for b in buckets if b != math.inf))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, self.kind, self.help)
+        for labels, child in self._series():
+            buckets, total, count = child.snapshot()
+            family.add_histogram(buckets, total, count, **labels)
+        return family
+
+
+# ============================================================================
+# REGISTRY
+# ============================================================================
+
+class MetricsRegistry:
+    """Named metrics plus scrape-time collectors"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} is already registered as a different "
+                                 f"{metric.kind} {metric.labelnames}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Counter by name (modules re-importing get the same instance)"""
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Gauge by name"""
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Histogram by name (bucket bounds in the metric's unit, usually seconds)"""
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """
+        Add a function called at every scrape that returns MetricFamily objects
+        for values kept elsewhere (engine stats, queue depths, ...)
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[MetricFamily]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"! Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        return families
+
+    def render(self) -> str:
+        """All metrics in the text exposition format"""
+        lines: List[str] = []
+        for family in self.collect():
+            family.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry the engine, auth, chat and storage layers report into
+REGISTRY = MetricsRegistry()
+
+
+# ============================================================================
+# HTTP MIDDLEWARE
+# ============================================================================
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them per route.
+
+    Requests are labelled with the route template ('/chat/messages'), never the
+    raw path, so label cardinality stays bounded; unmatched paths share one
+    'unmatched' label.
+    """
+
+    def __init__(self, app, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        registry = registry or REGISTRY
+        self.requests = registry.counter(
+            'kropscan_http_requests_total', 'HTTP requests by route and status',
+            ('method', 'route', 'status'))
+        self.latency = registry.histogram(
+            'kropscan_http_request_duration_seconds', 'HTTP request latency (until the response is sent)',
+            ('method', 'route'))
+        self.in_flight = registry.gauge(
+            'kropscan_http_requests_in_flight', 'HTTP requests being served')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight.dec()
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            method = scope['method']
+            self.requests.labels(method, route, status[0]).inc()
+            self.latency.labels(method, route).observe(elapsed)
@@ -0,0 +1,212 @@
+"""
+Model Export for KropScan
+Converts the trained timm checkpoint into TorchScript and ONNX artifacts and
+provides the ONNX Runtime wrapper used by KropScanAI's non-eager backends
+"""
+import argparse
+import inspect
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import torch
+import timm
+
+# File extension of each exported artifact, next to the .pth checkpoint
+ARTIFACT_EXTENSIONS = {
+    'torchscript': '.ts',
+    'onnxruntime': '.onnx',
+    'quantized': '.int8.ts',  # produced by model_quantization.py
+}
+
+
+def default_artifact_path(model_path: str, backend: str) -> str:
+    """Artifact path for a backend, derived from the checkpoint path"""
+    return os.path.splitext(model_path)[0] + ARTIFACT_EXTENSIONS[backend]
+
+
+def load_state_dict(weights_path: str, device='cpu') -> Dict[str, torch.Tensor]:
+    """
+    Load a state dict with its tensors memory-mapped from disk where possible.
+
+    Mapped weights are backed by the page cache instead of private heap memory,
+    so loading is fast and every process serving the same file shares one copy.
+    `.safetensors` files are read with safetensors; checkpoints saved by
+    torch.save use torch.load(mmap=True), falling back to a regular load for
+    old-format files or torch releases without mmap support.
+    """
+    if weights_path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        return load_file(weights_path, device=str(device))
+
+    try:
+        return torch.load(weights_path, map_location=device, mmap=True, weights_only=True)
+    except (TypeError, RuntimeError):
+        return torch.load(weights_path, map_location=device)
+
+
+def load_eager_model(model_path: str, config_path: str) -> Tuple[torch.nn.Module, Dict]:
+    """Build the timm model described by model_info.json and load its weights on CPU"""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+
+    model = timm.create_model(
+        config['model_architecture'],
+        pretrained=False,
+        num_classes=config['num_classes']
+    )
+    model.load_state_dict(load_state_dict(model_path), assign=True)
+    model.eval()
+    return model, config
+
+
+def example_input(config: Dict, batch_size: int = 1) -> torch.Tensor:
+    """Random input shaped like a preprocessed batch"""
+    height, width = config['input_size']
+    return torch.randn(batch_size, 3, height, width)
+
+
+def export_torchscript(model: torch.nn.Module, config: Dict, output_path: str) -> str:
+    """Trace and freeze the model into a TorchScript file"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input(config))
+        frozen = torch.jit.freeze(traced.eval())
+    frozen.save(output_path)
+    print(f"+ TorchScript model saved to: {output_path}")
+    return output_path
+
+
+def export_onnx(model: torch.nn.Module, config: Dict, output_path: str, opset: int = 17) -> str:
+    """Export the model to ONNX with a dynamic batch dimension"""
+    kwargs = {}
+    # Newer torch releases default to the dynamo exporter; keep the tracing one
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example_input(config),
+            output_path,
+            input_names=['input'],
+            output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset,
+            do_constant_folding=True,
+            **kwargs
+        )
+    print(f"+ ONNX model saved to: {output_path}")
+    return output_path
+
+
+class OnnxRuntimeModel:
+    """
+    Callable wrapper that makes an ONNX Runtime session look like a torch model:
+    it takes a (N, C, H, W) float tensor and returns a logits tensor.
+    """
+
+    def __init__(self, onnx_path: str, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            onnx_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        array = input_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        logits = self.session.run(None, {self.input_name: array})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+def load_backend_model(backend: str, artifact_path: str, device):
+    """Load an exported artifact for the given backend"""
+    if backend == 'torchscript':
+        model = torch.jit.load(artifact_path, map_location=device)
+        model.eval()
+        return model
+    if backend == 'quantized':
+        # INT8 kernels are CPU-only
+        model = torch.jit.load(artifact_path, map_location='cpu')
+        model.eval()
+        return model
+    if backend == 'onnxruntime':
+        return OnnxRuntimeModel(artifact_path)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+
+def verify_equivalence(
+    eager_model: torch.nn.Module,
+    backend_model,
+    config: Dict,
+    batch_size: int = 4,
+    atol: float = 1e-3
+) -> Dict:
+    """
+    Compare a backend's outputs with eager PyTorch on the same random batch.
+
+    Returns:
+        Dictionary with max absolute logit difference, top-1 agreement and a pass flag
+    """
+    inputs = example_input(config, batch_size)
+    with torch.no_grad():
+        expected = eager_model(inputs)
+        actual = backend_model(inputs)
+
+    max_diff = (expected - actual).abs().max().item()
+    top1_agreement = (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item()
+    return {
+        'max_abs_diff': max_diff,
+        'top1_agreement': top1_agreement,
+        'passed': max_diff <= atol and top1_agreement == 1.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the KropScan model to TorchScript and ONNX")
+    parser.add_argument('--model', default='kropscan_production_model.pth', help='Trained weights (.pth)')
+    parser.add_argument('--config', default='model_info.json', help='Model configuration')
+    parser.add_argument('--backends', nargs='+', default=['torchscript', 'onnxruntime'],
+                        choices=['torchscript', 'onnxruntime'], help='Artifacts to produce')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version')
+    parser.add_argument('--atol', type=float, default=1e-3, help='Allowed max logit difference')
+    args = parser.parse_args()
+
+    print("="*80)
+    print("KROPSCAN MODEL EXPORT")
+    print("="*80)
+
+    model, config = load_eager_model(args.model, args.config)
+    all_passed = True
+
+    for backend in args.backends:
+        output_path = default_artifact_path(args.model, backend)
+        if backend == 'torchscript':
+            export_torchscript(model, config, output_path)
+        else:
+            export_onnx(model, config, output_path, opset=args.opset)
+
+        report = verify_equivalence(model, load_backend_model(backend, output_path, 'cpu'), config, atol=args.atol)
+        status = "+" if report['passed'] else "-"
+        print(f"{status} {backend}: max |diff| = {report['max_abs_diff']:.2e}, "
+              f"top-1 agreement = {report['top1_agreement']:.0%}")
+        all_passed = all_passed and report['passed']
+
+    print("="*80)
+    print("+ EXPORT COMPLETE" if all_passed else "- EXPORT FINISHED WITH EQUIVALENCE FAILURES")
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+INT8 Quantization for KropScan
+Produces CPU-friendly quantized models and measures their accuracy cost
+"""
+import argparse
+import json
+import os
+import platform
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from ai_engine import IMAGE_EXTENSIONS
+from model_export import default_artifact_path, example_input, load_eager_model
+
+
+def select_quantized_engine() -> str:
+    """Pick the quantized kernel library for this CPU"""
+    supported = torch.backends.quantized.supported_engines
+    if platform.machine().lower() in ('arm64', 'aarch64') and 'qnnpack' in supported:
+        engine = 'qnnpack'
+    elif 'x86' in supported:
+        engine = 'x86'
+    else:
+        engine = 'fbgemm'
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def default_val_dir() -> str:
+    """Validation split used by train_enhanced.py"""
+    if os.path.exists('KropScan_Ultimate_Dataset/valid'):
+        return 'KropScan_Ultimate_Dataset/valid'
+    return 'New Plant Diseases Dataset(Augmented)/valid'
+
+
+def list_images(folder: str, limit: Optional[int] = None) -> List[str]:
+    """Collect image paths under a folder, sorted for reproducibility"""
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def quantize_dynamic_model(model: nn.Module) -> nn.Module:
+    """INT8 dynamic quantization of the Linear classifier head"""
+    select_quantized_engine()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_model(
+    model: nn.Module,
+    config: Dict,
+    calibration_dir: str,
+    num_images: int = 256,
+    batch_size: int = 32
+) -> nn.Module:
+    """
+    Post-training static quantization (FX graph mode).
+
+    Observers are inserted into the graph, a calibration pass over sample images
+    records activation ranges, and the model is converted to INT8 kernels.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    from ai_engine import ImagePreprocessor
+
+    engine = select_quantized_engine()
+    paths = list_images(calibration_dir, num_images)
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping(engine), (example_input(config),))
+
+    preprocessor = ImagePreprocessor.from_config(config)
+    print(f"+ Calibrating on {len(paths)} images ({engine} engine)...")
+    with torch.no_grad():
+        for start in range(0, len(paths), batch_size):
+            batch = []
+            for path in paths[start:start + batch_size]:
+                with open(path, 'rb') as f:
+                    batch.append(preprocessor(f.read()))
+            prepared(torch.stack(batch))
+
+    return convert_fx(prepared)
+
+
+def save_quantized_model(model: nn.Module, config: Dict, output_path: str) -> str:
+    """Trace a quantized model into a self-contained TorchScript file"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_input(config))
+        traced = torch.jit.freeze(traced.eval())
+    traced.save(output_path)
+    print(f"+ Quantized model saved to: {output_path}")
+    return output_path
+
+
+def evaluate_accuracy(model, config: Dict, val_dir: str, max_images: Optional[int] = None,
+                      batch_size: int = 32) -> float:
+    """
+    Top-1 accuracy (%) on an ImageFolder-style validation split.
+
+    Folder names are mapped through model_info.json class_names, so the index
+    order matches the one the model was trained with.
+    """
+    from ai_engine import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor.from_config(config)
+    class_index = {name: i for i, name in enumerate(config['class_names'])}
+
+    samples = []
+    for class_name in sorted(os.listdir(val_dir)):
+        if class_name not in class_index:
+            continue
+        for path in list_images(os.path.join(val_dir, class_name)):
+            samples.append((path, class_index[class_name]))
+    if max_images:
+        # Spread the subset across classes instead of taking the first folders
+        step = max(1, len(samples) // max_images)
+        samples = samples[::step][:max_images]
+    if not samples:
+        raise ValueError(f"No labelled images found in {val_dir}")
+
+    correct = 0
+    with torch.no_grad():
+        for start in range(0, len(samples), batch_size):
+            chunk = samples[start:start + batch_size]
+            batch = []
+            for path, _ in chunk:
+                with open(path, 'rb') as f:
+                    batch.append(preprocessor(f.read()))
+            predicted = model(torch.stack(batch)).argmax(dim=1)
+            labels = torch.tensor([label for _, label in chunk])
+            correct += (predicted == labels).sum().item()
+
+    return 100.0 * correct / len(samples)
+
+
+def model_size_mb(path: str) -> float:
+    return os.path.getsize(path) / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the KropScan model to INT8 for CPU inference")
+    parser.add_argument('--model', default='kropscan_production_model.pth', help='Trained weights (.pth)')
+    parser.add_argument('--config', default='model_info.json', help='Model configuration')
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='static', help='Quantization mode')
+    parser.add_argument('--calibration-dir', help='Sample images for static calibration (default: validation split)')
+    parser.add_argument('--calibration-images', type=int, default=256, help='Images used for calibration')
+    parser.add_argument('--val-dir', default=None, help='Validation split (default: same as train_enhanced.py)')
+    parser.add_argument('--val-images', type=int, default=2000, help='Validation images for the accuracy check (0 = all)')
+    parser.add_argument('--output', default=None, help='Output TorchScript path')
+    args = parser.parse_args()
+
+    print("="*80)
+    print(f"KROPSCAN INT8 QUANTIZATION ({args.mode.upper()})")
+    print("="*80)
+
+    model, config = load_eager_model(args.model, args.config)
+    val_dir = args.val_dir or default_val_dir()
+
+    if args.mode == 'dynamic':
+        quantized = quantize_dynamic_model(model)
+    else:
+        quantized = quantize_static_model(
+            load_eager_model(args.model, args.config)[0],
+            config,
+            args.calibration_dir or val_dir,
+            num_images=args.calibration_images
+        )
+
+    output_path = args.output or default_artifact_path(args.model, 'quantized')
+    save_quantized_model(quantized, config, output_path)
+    print(f"+ Size: {model_size_mb(args.model):.1f} MB -> {model_size_mb(output_path):.1f} MB")
+
+    if os.path.isdir(val_dir):
+        max_images = args.val_images or None
+        print(f"+ Evaluating on {val_dir}...")
+        fp32_acc = evaluate_accuracy(model, config, val_dir, max_images)
+        int8_acc = evaluate_accuracy(torch.jit.load(output_path), config, val_dir, max_images)
+        report = {
+            'mode': args.mode,
+            'fp32_accuracy': fp32_acc,
+            'int8_accuracy': int8_acc,
+            'accuracy_delta': int8_acc - fp32_acc,
+            'artifact': output_path
+        }
+        print(f"+ FP32 accuracy: {fp32_acc:.2f}%")
+        print(f"+ INT8 accuracy: {int8_acc:.2f}%")
+        print(f"+ Delta: {int8_acc - fp32_acc:+.2f} points")
+        with open(os.path.splitext(output_path)[0] + '_report.json', 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(f"! Validation split not found ({val_dir}) - skipping accuracy check")
+
+    print("="*80)
+
+
+if __name__ == "__main__":
+    main()
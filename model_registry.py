@@ -0,0 +1,191 @@
+"""
+Model Registry for KropScan
+Directory of versioned model artifacts, each described by its model_info.json
+
+Layout:
+    models/
+        CURRENT                      <- name of the version to serve
+        v20260101-120000/
+            kropscan_production_model.pth
+            model_info.json          <- manifest (plus 'version' / 'registered_at')
+            kropscan_production_model.ts / .onnx / .int8.ts  (optional exports)
+
+Running engines that watch the registry (KropScanAI.watch_registry) load a
+newly activated version in the background and swap it in without a restart.
+
+Usage:
+    python model_registry.py register --model kropscan_production_model.pth --config model_info.json
+    python model_registry.py list
+    python model_registry.py activate v20260101-120000
+"""
+import argparse
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+MODEL_FILENAME = 'kropscan_production_model.pth'
+MANIFEST_FILENAME = 'model_info.json'
+CURRENT_FILENAME = 'CURRENT'
+# Exported artifacts that travel with the weights (see model_export.py)
+ARTIFACT_SUFFIXES = ('.ts', '.onnx', '.int8.ts')
+
+
+@dataclass
+class ModelVersion:
+    """One registered model"""
+    version: str
+    model_path: str
+    config_path: str
+    manifest: Dict[str, Any]
+
+
+class ModelRegistry:
+    """Versioned model artifacts under one directory"""
+
+    def __init__(self, root: str = 'models'):
+        """
+        Args:
+            root: Registry directory (created on first register())
+        """
+        self.root = root
+
+    def list_versions(self) -> List[str]:
+        """Registered versions, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        versions = [name for name in os.listdir(self.root)
+                    if not name.startswith('.')
+                    and os.path.isfile(os.path.join(self.root, name, MANIFEST_FILENAME))]
+        return sorted(versions, key=lambda name: self._manifest(name).get('registered_at', ''))
+
+    def get(self, version: Optional[str] = None) -> ModelVersion:
+        """
+        Look up a version (None = the active one)
+
+        Raises:
+            KeyError: Unknown version, or no active version
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise KeyError(f"no active model in {self.root}")
+        version_dir = os.path.join(self.root, version)
+        if not os.path.isfile(os.path.join(version_dir, MANIFEST_FILENAME)):
+            raise KeyError(f"unknown model version: {version}")
+        return ModelVersion(
+            version=version,
+            model_path=os.path.join(version_dir, MODEL_FILENAME),
+            config_path=os.path.join(version_dir, MANIFEST_FILENAME),
+            manifest=self._manifest(version)
+        )
+
+    def current_version(self) -> Optional[str]:
+        """Active version named in CURRENT (falls back to the newest version)"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILENAME), 'r') as f:
+                version = f.read().strip()
+            if version:
+                return version
+        except OSError:
+            pass
+        versions = self.list_versions()
+        return versions[-1] if versions else None
+
+    def activate(self, version: str):
+        """Point CURRENT at a registered version (atomic rename)"""
+        self.get(version)
+        current_path = os.path.join(self.root, CURRENT_FILENAME)
+        tmp_path = current_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, current_path)
+        print(f"+ Active model: {version}")
+
+    def register(self, model_path: str, config_path: str, version: Optional[str] = None,
+                 activate: bool = False) -> ModelVersion:
+        """
+        Copy a trained model (and any exported artifacts next to it) into the registry
+
+        Args:
+            model_path: Trained weights (.pth)
+            config_path: Its model_info.json
+            version: Version name (default: timestamp)
+            activate: Also make it the active version
+
+        Returns:
+            The registered ModelVersion
+        """
+        version = version or datetime.now().strftime('v%Y%m%d-%H%M%S')
+        version_dir = os.path.join(self.root, version)
+        if os.path.exists(version_dir):
+            raise ValueError(f"model version already exists: {version}")
+
+        # Stage in a temp dir so watchers never see a half-copied version
+        staging_dir = os.path.join(self.root, f".staging-{version}")
+        os.makedirs(staging_dir)
+        try:
+            shutil.copy2(model_path, os.path.join(staging_dir, MODEL_FILENAME))
+            stem = os.path.splitext(model_path)[0]
+            for suffix in ARTIFACT_SUFFIXES:
+                if os.path.exists(stem + suffix):
+                    shutil.copy2(stem + suffix, os.path.join(staging_dir, os.path.splitext(MODEL_FILENAME)[0] + suffix))
+
+            with open(config_path, 'r') as f:
+                manifest = json.load(f)
+            manifest['version'] = version
+            manifest['registered_at'] = datetime.now().isoformat()
+            with open(os.path.join(staging_dir, MANIFEST_FILENAME), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            os.replace(staging_dir, version_dir)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        print(f"+ Registered model {version} ({manifest.get('model_architecture', '?')}, "
+              f"{manifest.get('best_val_accuracy', 0):.2f}% val)")
+        if activate:
+            self.activate(version)
+        return self.get(version)
+
+    def _manifest(self, version: str) -> Dict[str, Any]:
+        with open(os.path.join(self.root, version, MANIFEST_FILENAME), 'r') as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned KropScan models")
+    parser.add_argument('--root', default='models', help='Registry directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register = subparsers.add_parser('register', help='Add a trained model')
+    register.add_argument('--model', default=MODEL_FILENAME, help='Trained weights (.pth)')
+    register.add_argument('--config', default=MANIFEST_FILENAME, help='Model configuration')
+    register.add_argument('--version', default=None, help='Version name (default: timestamp)')
+    register.add_argument('--activate', action='store_true', help='Serve it right away')
+
+    subparsers.add_parser('list', help='Show registered versions')
+
+    activate = subparsers.add_parser('activate', help='Serve a registered version')
+    activate.add_argument('version')
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'register':
+        registry.register(args.model, args.config, args.version, args.activate)
+    elif args.command == 'activate':
+        registry.activate(args.version)
+    else:
+        current = registry.current_version()
+        for version in registry.list_versions():
+            manifest = registry.get(version).manifest
+            marker = '*' if version == current else ' '
+            print(f"{marker} {version}  {manifest.get('model_architecture', '?'):<20} "
+                  f"{manifest.get('best_val_accuracy', 0):6.2f}%  {manifest.get('registered_at', '')}")
+
+
+if __name__ == "__main__":
+    main()
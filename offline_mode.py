@@ -5,6 +5,7 @@ from typing import Dict, Optional, Tuple
 from PIL import Image
 import torchvision.transforms as transforms
 import numpy as np
+from treatment_store import load_treatment_store
 
 class OfflineMode:
     """
@@ -42,8 +43,12 @@ class OfflineMode:
         Load the lightweight offline model
         """
         try:
-            # Load model with CPU device for offline use
-            self.offline_model = torch.load(self.offline_model_path, map_location='cpu')
+            # Load model with CPU device for offline use. Quantized models from
+            # create_lightweight_model are TorchScript; older ones are pickled modules
+            try:
+                self.offline_model = torch.jit.load(self.offline_model_path, map_location='cpu')
+            except RuntimeError:
+                self.offline_model = torch.load(self.offline_model_path, map_location='cpu')
             self.offline_model.eval()
             print("✅ Offline model loaded successfully")
         except Exception as e:
@@ -55,8 +60,9 @@ class OfflineMode:
         Load the treatment database for offline use
         """
         try:
-            with open(self.treatment_db_path, 'r') as f:
+            with open(self.treatment_db_path, 'r', encoding='utf-8') as f:
                 self.treatment_database = json.load(f)
+            self.treatments = load_treatment_store(self.treatment_db_path)
             print("✅ Treatment database loaded successfully")
         except Exception as e:
             print(f"❌ Error loading treatment database: {e}")
@@ -108,11 +114,7 @@ class OfflineMode:
                     disease_name = "Unknown"
                 
                 # Get treatment information
-                treatment_info = self.treatment_database.get(disease_name, 
-                    {"treatment": "Offline treatment information not available. Please connect to internet for full details."})
-                
-                treatment_text = treatment_info.get("treatment", 
-                    "Offline treatment information not available. Please connect to internet for full details.")
+                treatment_text = self.treatments.get(disease_name)
                 
                 return disease_name, confidence, treatment_text
         except Exception as e:
@@ -192,23 +194,36 @@ class OfflineMode:
         
         return synced_count
     
-    def create_lightweight_model(self, original_model_path: str, output_path: str):
+    def create_lightweight_model(self, original_model_path: str, output_path: str,
+                                 config_path: str = "model_info.json",
+                                 calibration_dir: Optional[str] = None):
         """
-        Create a lightweight version of the model for offline use
-        This is a simplified version - in practice, you'd use model compression techniques
+        Create a lightweight INT8 version of the model for offline use
+
+        With a calibration folder the whole network is statically quantized
+        (post-training, FX graph mode); without one only the classifier is
+        dynamically quantized. The result is saved as TorchScript so it loads
+        without timm.
         """
         try:
+            from model_export import load_eager_model
+            from model_quantization import (quantize_dynamic_model, quantize_static_model,
+                                            save_quantized_model)
+
             # Load original model
-            original_model = torch.load(original_model_path, map_location='cpu')
-            
-            # For this example, we'll just save the model as is
-            # In a real implementation, you might:
-            # - Quantize the model (torch.quantization)
-            # - Prune less important weights
-            # - Use knowledge distillation to create a smaller model
-            torch.save(original_model, output_path)
-            
-            print(f"✅ Lightweight model created at: {output_path}")
+            original_model, config = load_eager_model(original_model_path, config_path)
+
+            if calibration_dir:
+                quantized_model = quantize_static_model(original_model, config, calibration_dir)
+            else:
+                quantized_model = quantize_dynamic_model(original_model)
+
+            save_quantized_model(quantized_model, config, output_path)
+
+            original_size = os.path.getsize(original_model_path) / 1024 ** 2
+            quantized_size = os.path.getsize(output_path) / 1024 ** 2
+            print(f"✅ Lightweight model created at: {output_path} "
+                  f"({original_size:.1f} MB -> {quantized_size:.1f} MB)")
             return True
         except Exception as e:
             print(f"❌ Error creating lightweight model: {e}")
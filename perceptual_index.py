@@ -0,0 +1,164 @@
+"""
+Perceptual Hash Index for KropScan
+Finds near-duplicate uploads (recompressed, resized, re-shared photos)
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Number of set bits for every byte value, used for vectorized popcount
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image as a 64-bit integer.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail and
+    each bit records whether a pixel is brighter than its right-hand neighbour.
+    JPEG recompression and rescaling leave most bits unchanged.
+    """
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+class PerceptualHashIndex:
+    """
+    Fixed-capacity index of 64-bit perceptual hashes with Hamming-radius lookup.
+
+    Hashes live in a NumPy ring buffer; the oldest entry is overwritten once the
+    index is full. Lookups use multi-index hashing: each hash is split into
+    `max_distance + 1` disjoint bit chunks, and by the pigeonhole principle any
+    hash within `max_distance` bits must match the query exactly on at least one
+    chunk. Only those candidates are compared, with a vectorized popcount.
+    """
+
+    def __init__(self, capacity: int = 200000, max_distance: int = 2):
+        """
+        Args:
+            capacity: Maximum number of hashes kept (oldest evicted first)
+            max_distance: Largest Hamming distance counted as a near-duplicate
+                (small by default: a near match reuses another photo's diagnosis)
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if not 0 <= max_distance < 64:
+            raise ValueError("max_distance must be between 0 and 63")
+
+        self.capacity = capacity
+        self.max_distance = max_distance
+
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._values: List[Any] = [None] * capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+        # Split 64 bits into max_distance + 1 chunks as evenly as possible
+        num_chunks = max_distance + 1
+        widths = [64 // num_chunks + (1 if i < 64 % num_chunks else 0) for i in range(num_chunks)]
+        self._chunks: List[Tuple[int, int]] = []
+        shift = 0
+        for width in widths:
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables: List[Dict[int, set]] = [{} for _ in self._chunks]
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _chunk_keys(self, value: int) -> List[int]:
+        return [(value >> shift) & mask for shift, mask in self._chunks]
+
+    def add(self, hash_value: int, value: Any):
+        """Insert a hash with its associated value, evicting the oldest if full"""
+        with self._lock:
+            slot = self._next
+
+            if self._size == self.capacity:
+                # Unlink the entry being overwritten
+                old_hash = int(self._hashes[slot])
+                for table, key in zip(self._tables, self._chunk_keys(old_hash)):
+                    bucket = table.get(key)
+                    if bucket is not None:
+                        bucket.discard(slot)
+                        if not bucket:
+                            del table[key]
+            else:
+                self._size += 1
+
+            self._hashes[slot] = np.uint64(hash_value)
+            self._values[slot] = value
+            for table, key in zip(self._tables, self._chunk_keys(hash_value)):
+                table.setdefault(key, set()).add(slot)
+
+            self._next = (slot + 1) % self.capacity
+
+    def lookup(self, hash_value: int) -> Optional[Tuple[Any, int]]:
+        """
+        Find the closest stored hash within max_distance.
+
+        Returns:
+            (value, distance) for the nearest match, or None
+        """
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._chunk_keys(hash_value)):
+                bucket = table.get(key)
+                if bucket:
+                    candidates.update(bucket)
+
+            if not candidates:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            xor = self._hashes[slots] ^ np.uint64(hash_value)
+            distances = _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._values[int(slots[best])], distance
+
+    def reset_after_fork(self):
+        """New lock in a forked child (the parent's may have been held at fork time)"""
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._values = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+            self._tables = [{} for _ in self._chunks]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return lookup counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': self._size,
+                'capacity': self.capacity,
+                'max_distance': self.max_distance
+            }
@@ -0,0 +1,202 @@
+"""
+Prediction Cache for KropScan
+Content-addressed cache so repeated uploads of the same photo skip the model
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class PredictionCache:
+    """
+    Two-tier prediction cache keyed by image content and model version.
+
+    - Memory tier: in-process LRU of the most recent results
+    - Disk tier (optional): SQLite table shared across restarts and processes
+
+    Both tiers honour the same TTL. Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 50000,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        """
+        Args:
+            max_entries: Capacity of the in-memory LRU tier
+            disk_path: SQLite file for the persistent tier (None disables it)
+            disk_max_entries: Maximum rows kept in the disk tier
+            ttl_seconds: Entries older than this are treated as misses
+        """
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_writes = 0
+
+        # Counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_path:
+            self._init_disk()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str, extra: str = "") -> str:
+        """Build a cache key from image content and model version"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(model_version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(extra.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def _init_disk(self):
+        """Open the SQLite tier and create its table"""
+        try:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_predictions_access ON predictions(last_access)"
+            )
+            self._conn.commit()
+        except Exception as e:
+            print(f"- Prediction cache disk tier unavailable: {e}")
+            self._conn = None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created_at FROM predictions WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        if now - row[1] <= self.ttl_seconds:
+                            self._conn.execute(
+                                "UPDATE predictions SET last_access = ? WHERE key = ?", (now, key)
+                            )
+                            self._conn.commit()
+                            value = json.loads(row[0])
+                            self._store_memory(key, value, row[1])
+                            self.disk_hits += 1
+                            return value
+                        self._conn.execute("DELETE FROM predictions WHERE key = ?", (key,))
+                        self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"- Prediction cache read error: {e}")
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any):
+        """Store a value in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, value, now)
+
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO predictions (key, value, created_at, last_access)"
+                        " VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), now, now)
+                    )
+                    # Amortize the size check instead of counting rows on every write
+                    self._disk_writes += 1
+                    if self._disk_writes % 64 == 0:
+                        self._evict_disk(now)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"- Prediction cache write error: {e}")
+
+    def _store_memory(self, key: str, value: Any, created_at: float):
+        """Insert into the LRU tier, evicting the least recently used entry"""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self, now: float):
+        """Drop expired rows and trim the disk tier to its size limit"""
+        self._conn.execute(
+            "DELETE FROM predictions WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        overflow = count - self.disk_max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM predictions WHERE key IN ("
+                " SELECT key FROM predictions ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM predictions")
+                self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            disk_entries = 0
+            if self._conn is not None:
+                try:
+                    disk_entries = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk_entries
+            }
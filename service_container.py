@@ -0,0 +1,124 @@
+"""
+Service Container for KropScan
+Builds each heavy service (AI engine, user table, auth, chat, chatbot) once,
+on first use, and hands the same instance to every caller in the process.
+
+backend.py resolves services through FastAPI dependencies and builds them in
+its lifespan hook; frontend.py keeps its container in st.cache_resource.
+Auth and community chat share one UserManagement, so there is a single
+in-memory copy of users.json per process.
+
+Usage:
+    services = ServiceContainer()
+    services.register('chatbot', KropBot)
+    register_user_services(services)
+
+    bot = services.get('chatbot')          # built here, cached afterwards
+    services.override('chatbot', FakeBot())  # tests / load tests
+    services.close()                       # at shutdown
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ServiceContainer:
+    """Named lazy singletons with optional shutdown hooks"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._closers: Dict[str, Callable[[Any], None]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._built: List[str] = []  # build order, closed in reverse
+        # Re-entrant: a factory may get() the services it depends on
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None):
+        """
+        Declare a service (nothing is built yet)
+
+        Args:
+            name: Service name
+            factory: Builds the service; may return None when it is disabled.
+                An ImportError (optional dependency missing) also yields None.
+            close: Called with the instance by close()
+        """
+        with self._lock:
+            self._factories[name] = factory
+            if close is not None:
+                self._closers[name] = close
+
+    def get(self, name: str) -> Any:
+        """The service instance, built on first call"""
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name not in self._factories:
+                raise KeyError(f"unknown service: {name}")
+            try:
+                instance = self._factories[name]()
+                if instance is not None:
+                    print(f"+ {name} ready")
+            except ImportError as e:
+                print(f"- {name} not available: {e}")
+                instance = None
+            self._instances[name] = instance
+            self._built.append(name)
+            return instance
+
+    def peek(self, name: str) -> Any:
+        """The instance if it has been built, else None (never builds)"""
+        return self._instances.get(name)
+
+    def override(self, name: str, instance: Any):
+        """Use a ready-made instance (or None to disable the service) instead of the factory"""
+        with self._lock:
+            self._instances[name] = instance
+            if name in self._built:
+                self._built.remove(name)  # not ours to close
+
+    def dependency(self, name: str) -> Callable[[], Any]:
+        """FastAPI dependency resolving to the service: Depends(services.dependency('auth'))"""
+        def resolve():
+            return self.get(name)
+        resolve.__name__ = f"get_{name}"
+        return resolve
+
+    def close(self):
+        """Run shutdown hooks in reverse build order and forget the instances"""
+        with self._lock:
+            built, self._built = self._built, []
+            for name in reversed(built):
+                instance = self._instances.pop(name, None)
+                closer = self._closers.get(name)
+                if instance is not None and closer is not None:
+                    try:
+                        closer(instance)
+                    except Exception as e:
+                        print(f"! Error closing {name}: {e}")
+
+
+def register_user_services(services: ServiceContainer, users_file: str = 'users.json',
+                           sessions_file: str = 'sessions.json', chat_file: str = 'community_chat.json'):
+    """
+    Register 'user_manager', 'auth_system' and 'community_chat', wired to
+    share a single UserManagement (one load of the users file)
+    """
+    def build_user_manager():
+        from user_management import UserManagement
+        return UserManagement(users_file)
+
+    def build_auth_system():
+        from auth_system import AuthSystem
+        return AuthSystem(users_file, sessions_file, user_manager=services.get('user_manager'))
+
+    def build_community_chat():
+        from community_chat import CommunityChat
+        return CommunityChat(chat_file, user_manager=services.get('user_manager'))
+
+    services.register('user_manager', build_user_manager)
+    services.register('auth_system', build_auth_system)
+    services.register('community_chat', build_community_chat)
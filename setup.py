@@ -50,6 +50,11 @@ def create_sample_data():
         }
     }
 
+    # Never overwrite the full knowledge base shipped with the app
+    if os.path.exists("treatment_database.json"):
+        print("SUCCESS: Treatment database already present")
+        return
+
     import json
     with open("treatment_database.json", "w", encoding="utf-8") as f:
         json.dump(sample_treatment_db, f)
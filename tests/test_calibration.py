@@ -0,0 +1,26 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from calibration import expected_calibration_error  # noqa: E402
+
+
+def test_perfectly_calibrated_predictions_have_zero_error():
+    # 80% confident and right 4 times out of 5
+    probabilities = torch.tensor([[0.8, 0.2]] * 5)
+    labels = torch.tensor([0, 0, 0, 0, 1])
+    assert expected_calibration_error(probabilities, labels) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_overconfident_predictions():
+    # 90% confident but right half the time
+    probabilities = torch.tensor([[0.9, 0.1]] * 4)
+    labels = torch.tensor([0, 0, 1, 1])
+    assert expected_calibration_error(probabilities, labels) == pytest.approx(0.4, abs=1e-6)
+
+
+def test_bins_are_weighted_by_size():
+    # Bin near 0.95: 2 of 2 right (gap 0.05); bin near 0.55: 0 of 2 right (gap 0.55)
+    probabilities = torch.tensor([[0.95, 0.05], [0.95, 0.05], [0.55, 0.45], [0.55, 0.45]])
+    labels = torch.tensor([0, 0, 1, 1])
+    assert expected_calibration_error(probabilities, labels, bins=10) == pytest.approx(0.3, abs=1e-6)
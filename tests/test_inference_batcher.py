@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from inference_batcher import MicroBatcher
+
+
+def test_requests_arriving_together_share_a_batch():
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(5)]
+    assert [f.result(timeout=2) for f in futures] == [0, 2, 4, 6, 8]
+    assert sizes == [5]
+    batcher.stop()
+
+
+def test_batch_fn_errors_reach_every_caller():
+    def fail(items):
+        raise ValueError("bad batch")
+
+    batcher = MicroBatcher(fail, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.predict(1, timeout=2)
+    batcher.stop()
+
+
+def test_stop_drains_queued_requests_and_returns_promptly():
+    release = threading.Event()
+
+    def slow(items):
+        release.wait(2)
+        return items
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=1)
+    futures = [batcher.submit(i) for i in range(3)]
+    release.set()
+    start = time.monotonic()
+    batcher.stop()
+    assert time.monotonic() - start < 2
+    assert [f.result(timeout=0) for f in futures] == [0, 1, 2]
+    with pytest.raises(RuntimeError):
+        batcher.submit(4).result(timeout=0)
+
+
+def test_every_future_resolves_when_stop_races_submit():
+    for _ in range(20):
+        batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_wait_ms=0.1)
+        futures = []
+
+        def submit_many():
+            for i in range(200):
+                futures.append(batcher.submit(i))
+
+        thread = threading.Thread(target=submit_many)
+        thread.start()
+        batcher.stop()
+        thread.join()
+        for future in futures:
+            try:
+                future.result(timeout=1)
+            except RuntimeError:
+                pass  # submitted after stop()
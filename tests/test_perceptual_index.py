@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+from perceptual_index import PerceptualHashIndex, dhash  # noqa: E402
+
+# Deployments turn the index on with a radius of at most 2
+RADIUS = 2
+
+
+def leaf_photo(seed: int, size=(640, 480)) -> Image.Image:
+    """A leaf-like blob with veins and lesions on a soil-coloured background"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    image = Image.new('RGB', size, tuple(int(c) for c in rng.integers(60, 120, 3)))
+    draw = ImageDraw.Draw(image)
+    cx, cy = rng.integers(width // 3, 2 * width // 3), rng.integers(height // 3, 2 * height // 3)
+    rx, ry = rng.integers(width // 5, width // 3), rng.integers(height // 6, height // 3)
+    draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=(40, int(rng.integers(110, 190)), 50))
+    for _ in range(6):
+        x, y = rng.integers(cx - rx, cx + rx), rng.integers(cy - ry, cy + ry)
+        draw.line((cx, cy, x, y), fill=(150, 200, 120), width=4)
+    for _ in range(8):
+        x, y, r = rng.integers(cx - rx, cx + rx), rng.integers(cy - ry, cy + ry), rng.integers(8, 30)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(120, 80, 30))
+    return image
+
+
+def recompress(image: Image.Image, quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+
+
+def test_recompressed_and_resized_copies_match():
+    original = leaf_photo(1)
+    index = PerceptualHashIndex(capacity=16, max_distance=RADIUS)
+    index.add(dhash(original), 'leaf-1')
+
+    for copy in (recompress(original, 40), original.resize((320, 240)), recompress(original.resize((480, 360)), 60)):
+        match = index.lookup(dhash(copy))
+        assert match is not None
+        assert match[0] == 'leaf-1'
+        assert match[1] <= RADIUS
+
+
+def test_different_leaf_does_not_match():
+    index = PerceptualHashIndex(capacity=16, max_distance=RADIUS)
+    index.add(dhash(leaf_photo(1)), 'leaf-1')
+
+    for seed in range(2, 8):
+        assert index.lookup(dhash(leaf_photo(seed))) is None
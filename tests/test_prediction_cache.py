@@ -0,0 +1,76 @@
+import pytest
+
+import prediction_cache
+from prediction_cache import PredictionCache
+
+
+def test_key_depends_on_image_model_and_extra():
+    key = PredictionCache.make_key(b'image', 'v1', 'report:3:')
+    assert key == PredictionCache.make_key(b'image', 'v1', 'report:3:')
+    assert key != PredictionCache.make_key(b'image2', 'v1', 'report:3:')
+    assert key != PredictionCache.make_key(b'image', 'v2', 'report:3:')
+    assert key != PredictionCache.make_key(b'image', 'v1', 'report:3:Tomato')
+
+
+def test_memory_tier_is_lru():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}  # 'b' is now least recently used
+    cache.put('c', {'n': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.get('c') == {'n': 3}
+    stats = cache.get_stats()
+    assert (stats['memory_hits'], stats['misses'], stats['evictions']) == (3, 1, 1)
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'time', lambda: now[0])
+    cache = PredictionCache(max_entries=4, ttl_seconds=60)
+    cache.put('a', 'value')
+    now[0] += 59
+    assert cache.get('a') == 'value'
+    now[0] += 2
+    assert cache.get('a') is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = PredictionCache(max_entries=4, disk_path=path)
+    cache.put('a', {'disease': 'Tomato___healthy'})
+
+    reopened = PredictionCache(max_entries=4, disk_path=path)
+    assert reopened.get('a') == {'disease': 'Tomato___healthy'}
+    assert reopened.get('a') == {'disease': 'Tomato___healthy'}
+    stats = reopened.get_stats()
+    assert (stats['disk_hits'], stats['memory_hits']) == (1, 1)
+
+    reopened.clear()
+    assert PredictionCache(disk_path=path).get('a') is None
+
+
+def test_disk_tier_is_trimmed_to_its_limit(tmp_path):
+    cache = PredictionCache(max_entries=0, disk_path=str(tmp_path / 'cache.db'), disk_max_entries=10)
+    for i in range(128):
+        cache.put(f'key-{i}', i)
+    assert cache.get_stats()['disk_entries'] <= 10 + 64
+    assert cache.get('key-127') == 127
+    assert cache.get('key-0') is None
+
+
+def test_cached_report_edits_do_not_leak_into_the_cache():
+    pytest.importorskip("numpy")
+    from ai_engine import AnalysisReport, report_from_prediction
+
+    cache = PredictionCache(max_entries=4)
+    cache.put('a', report_from_prediction('Tomato___Early_blight', 0.9, 'Spray').to_dict())
+    first = AnalysisReport.from_dict(cache.get('a'))
+    first.metadata['request_id'] = 'abc'
+    first.top_k_predictions.clear()
+
+    second = AnalysisReport.from_dict(cache.get('a'))
+    assert second.metadata == {}
+    assert [p.class_name for p in second.top_k_predictions] == ['Tomato___Early_blight']
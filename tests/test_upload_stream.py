@@ -0,0 +1,162 @@
+import asyncio
+import io
+import struct
+
+import pytest
+
+import upload_stream
+from upload_stream import UploadLimits, UploadRejected, read_image_form, sniff_image
+
+needs_multipart = pytest.mark.skipif(upload_stream.MultipartParser is None, reason="python-multipart not installed")
+
+BOUNDARY = b'kropscan-test-boundary'
+
+
+def png_header(width: int, height: int) -> bytes:
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+
+def jpeg_header(width: int, height: int) -> bytes:
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    return b'\xff\xd8' + app0 + sof0
+
+
+def webp_header(chunk: bytes, payload: bytes) -> bytes:
+    body = b'WEBP' + chunk + struct.pack('<I', len(payload)) + payload
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def vp8(width: int, height: int) -> bytes:
+    return webp_header(b'VP8 ', b'\x00\x00\x00\x9d\x01\x2a' + struct.pack('<HH', width, height) + b'\x00' * 4)
+
+
+def vp8l(width: int, height: int) -> bytes:
+    bits = (width - 1) | ((height - 1) << 14)
+    return webp_header(b'VP8L', b'\x2f' + struct.pack('<I', bits) + b'\x00' * 8)
+
+
+def vp8x(width: int, height: int) -> bytes:
+    payload = b'\x10\x00\x00\x00' + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+    return webp_header(b'VP8X', payload)
+
+
+# ============================================================================
+# sniff_image
+# ============================================================================
+
+@pytest.mark.parametrize('header, expected', [
+    (png_header(640, 480), ('png', 640, 480)),
+    (jpeg_header(4000, 3000), ('jpeg', 4000, 3000)),
+    (vp8(1024, 768), ('webp', 1024, 768)),
+    (vp8l(300, 200), ('webp', 300, 200)),
+    (vp8x(16383, 20000), ('webp', 16383, 20000)),
+])
+def test_sniff_reads_dimensions(header, expected):
+    assert sniff_image(header) == expected
+
+
+@pytest.mark.parametrize('header', [png_header(640, 480), jpeg_header(640, 480), vp8(640, 480)])
+def test_sniff_asks_for_more_bytes(header):
+    for cut in (1, 4, 10, 20):
+        assert sniff_image(header[:cut]) is None
+
+
+@pytest.mark.parametrize('header', [b'GIF89a\x01\x00\x01\x00', b'%PDF-1.7\n', b'RIFF\x00\x00\x00\x00WAVEfmt '])
+def test_sniff_rejects_other_formats(header):
+    with pytest.raises(UploadRejected) as error:
+        sniff_image(header)
+    assert error.value.status_code == 415
+
+
+def test_sniff_rejects_corrupt_png():
+    header = bytearray(png_header(640, 480))
+    header[12:16] = b'IDAT'
+    with pytest.raises(UploadRejected) as error:
+        sniff_image(bytes(header))
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('image_format, options', [('WEBP', {'lossless': False}), ('WEBP', {'lossless': True}),
+                                                   ('PNG', {}), ('JPEG', {})])
+def test_sniff_matches_pil(image_format, options):
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    try:
+        Image.new('RGB', (321, 123), (30, 140, 40)).save(buffer, format=image_format, **options)
+    except (KeyError, OSError):
+        pytest.skip(f"PIL built without {image_format}")
+    assert sniff_image(buffer.getvalue()) == (image_format.lower(), 321, 123)
+
+
+# ============================================================================
+# read_image_form
+# ============================================================================
+
+class FakeRequest:
+    """Just enough of a Starlette Request for read_image_form"""
+
+    def __init__(self, chunks, content_length=None, disconnect_after=None):
+        self.headers = {'content-type': f'multipart/form-data; boundary={BOUNDARY.decode()}'}
+        if content_length is not None:
+            self.headers['content-length'] = str(content_length)
+        self.chunks = chunks
+        self.disconnect_after = disconnect_after
+
+    async def stream(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.disconnect_after:
+                raise upload_stream.ClientDisconnect()
+            yield chunk
+
+
+def multipart_body(data: bytes, filename: str = 'leaf.png') -> bytes:
+    return (b'--' + BOUNDARY + b'\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="' + filename.encode() + b'"\r\n'
+            b'Content-Type: application/octet-stream\r\n\r\n' + data + b'\r\n'
+            b'--' + BOUNDARY + b'--\r\n')
+
+
+def read(request, limits=None):
+    return asyncio.run(read_image_form(request, limits or UploadLimits()))
+
+
+@needs_multipart
+def test_reads_a_complete_upload():
+    image = png_header(64, 48) + b'\x00' * 100
+    body = multipart_body(image)
+    form = read(FakeRequest([body[:50], body[50:]]))
+    assert [(i.format, i.width, i.height, i.data) for i in form.images] == [('png', 64, 48, image)]
+
+
+@needs_multipart
+def test_truncated_body_is_rejected():
+    body = multipart_body(png_header(64, 48) + b'\x00' * 100)
+    with pytest.raises(UploadRejected) as error:
+        read(FakeRequest([body[:len(body) // 2]]))
+    assert error.value.status_code == 400
+
+
+@needs_multipart
+def test_client_disconnect_is_rejected():
+    body = multipart_body(png_header(64, 48) + b'\x00' * 100)
+    with pytest.raises(UploadRejected) as error:
+        read(FakeRequest([body[:40], body[40:]], disconnect_after=1))
+    assert error.value.status_code == 400
+
+
+@needs_multipart
+def test_oversized_first_chunk_is_rejected():
+    limits = UploadLimits(max_file_bytes=1024, max_request_bytes=1024)
+    body = multipart_body(png_header(64, 48) + b'\x00' * (200 * 1024))
+    with pytest.raises(UploadRejected) as error:
+        read(FakeRequest([body]), limits)
+    assert error.value.status_code == 413
+
+
+@needs_multipart
+def test_declared_length_over_ceiling_is_rejected_before_reading():
+    limits = UploadLimits(max_file_bytes=1024, max_request_bytes=1024)
+    with pytest.raises(UploadRejected) as error:
+        read(FakeRequest([], content_length=10 * 1024 * 1024), limits)
+    assert error.value.status_code == 413
@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from user_management import UserManagement
+from user_store import DuplicateEmailError, JsonUserStore, SqliteUserStore
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'json':
+        store = JsonUserStore(str(tmp_path / 'users.json'))
+    else:
+        store = SqliteUserStore(str(tmp_path / 'users.db'))
+    yield store
+    store.close()
+
+
+def user(user_id, email=None, phone='9876543210'):
+    record = {'user_id': user_id, 'name': user_id.title(), 'phone': phone, 'notifications': []}
+    if email is not None:
+        record['email'] = email
+    return record
+
+
+def test_put_get_and_lookups(store):
+    store.put('a', user('a', 'a@example.com'))
+    store.put('b', user('b', 'b@example.com'))
+    store.put('c', user('c', phone='1111111111'))
+
+    assert store.get('a')['name'] == 'A'
+    assert store.get('missing') is None
+    assert store.find_by_email('b@example.com')['user_id'] == 'b'
+    assert store.find_by_email('nobody@example.com') is None
+    assert [u['user_id'] for u in store.find_by_phone('9876543210')] == ['a', 'b']
+    assert sorted(store.all()) == ['a', 'b', 'c']
+    assert len(store) == 3
+    assert store.delete('c') and not store.delete('c')
+
+
+def test_records_are_copies(store):
+    record = user('a', 'a@example.com')
+    store.put('a', record)
+    record['name'] = 'changed after put'
+    store.get('a')['name'] = 'changed after get'
+    store.find_by_email('a@example.com')['notifications'].append('x')
+    assert store.get('a') == user('a', 'a@example.com')
+
+
+def test_email_is_unique(store):
+    store.put('a', user('a', 'same@example.com'))
+    with pytest.raises(DuplicateEmailError):
+        store.put('b', user('b', 'same@example.com'))
+    assert store.get('b') is None
+    # Users without an email never conflict
+    store.put('c', user('c'))
+    store.put('d', user('d'))
+    # Re-saving a user with its own email is fine
+    store.put('a', dict(user('a', 'same@example.com'), name='Renamed'))
+    assert store.get('a')['name'] == 'Renamed'
+
+
+def test_update_applies_and_declines(store):
+    store.put('a', user('a', 'a@example.com'))
+    assert store.update('a', lambda u: u['notifications'].append('hello'))
+    assert store.get('a')['notifications'] == ['hello']
+
+    assert not store.update('a', lambda u: False)
+    assert not store.update('missing', lambda u: u.update(name='x'))
+
+    store.put('b', user('b', 'b@example.com'))
+    with pytest.raises(DuplicateEmailError):
+        store.update('b', lambda u: u.update(email='a@example.com'))
+    assert store.get('b')['email'] == 'b@example.com'
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    path = str(tmp_path / 'users.db')
+    stores = [SqliteUserStore(path) for _ in range(4)]
+    stores[0].put('a', user('a'))
+
+    def append(store, worker):
+        for i in range(25):
+            store.update('a', lambda u: u['notifications'].append((worker, i)))
+
+    threads = [threading.Thread(target=append, args=(store, n)) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stores[0].get('a')['notifications']) == 100
+    for store in stores:
+        store.close()
+
+
+def test_migrate_json_keeps_first_user_per_email(tmp_path):
+    users_json = tmp_path / 'users.json'
+    users_json.write_text(json.dumps({
+        'a': user('a', 'shared@example.com'),
+        'b': user('b', 'shared@example.com'),
+        'c': user('c', 'c@example.com'),
+    }))
+    store = SqliteUserStore(str(tmp_path / 'users.db'), migrate_from=str(users_json))
+    assert store.find_by_email('shared@example.com')['user_id'] == 'a'
+    assert sorted(store.all()) == ['a', 'c']
+    # One-shot: reopening does not import again
+    store.close()
+    users_json.write_text(json.dumps({'d': user('d')}))
+    store = SqliteUserStore(str(tmp_path / 'users.db'), migrate_from=str(users_json))
+    assert store.get('d') is None
+    store.close()
+
+
+def test_migration_waits_for_users_json_to_exist(tmp_path):
+    users_json = tmp_path / 'users.json'
+    store = SqliteUserStore(str(tmp_path / 'users.db'), migrate_from=str(users_json))
+    assert store.all() == {}
+    store.close()
+    users_json.write_text(json.dumps({'a': user('a')}))
+    store = SqliteUserStore(str(tmp_path / 'users.db'), migrate_from=str(users_json))
+    assert store.get('a') is not None
+    store.close()
+
+
+def test_email_lookup_uses_the_unique_index(tmp_path):
+    store = SqliteUserStore(str(tmp_path / 'users.db'))
+    plan = store._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM users WHERE email = ? ORDER BY rowid LIMIT 1", ('x',)).fetchall()
+    assert any('idx_users_email_unique' in row[-1] for row in plan)
+    store.close()
+
+
+def test_older_database_is_upgraded_to_unique_emails(tmp_path):
+    path = str(tmp_path / 'users.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (user_id TEXT PRIMARY KEY, email TEXT, phone TEXT,"
+                 " data TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("CREATE INDEX idx_users_email ON users(email)")
+    conn.execute("INSERT INTO users VALUES ('a', 'a@example.com', NULL, ?, 0)", (json.dumps(user('a', 'a@example.com')),))
+    conn.commit()
+    conn.close()
+
+    store = SqliteUserStore(path)
+    indexes = {row[1] for row in store._conn.execute("PRAGMA index_list(users)")}
+    assert 'idx_users_email_unique' in indexes and 'idx_users_email' not in indexes
+    with pytest.raises(DuplicateEmailError):
+        store.put('b', user('b', 'a@example.com'))
+    store.close()
+
+
+def test_user_management_rejects_duplicate_registration(store):
+    manager = UserManagement(store=store)
+    first = manager.register_user('Ravi', '9876543210', 'Pune', 1.5, email='ravi@example.com')
+    assert first is not None
+    assert manager.register_user('Other', '9876543211', 'Pune', email='ravi@example.com') is None
+
+    assert manager.send_notification(first, 'Rain expected')
+    notification = manager.get_unread_notifications(first)[0]
+    assert manager.mark_notification_as_read(first, notification['id'])
+    assert not manager.mark_notification_as_read(first, 'no-such-id')
+    assert manager.get_unread_notifications(first) == []
+
+    users = manager.users
+    with pytest.raises(TypeError):
+        users['intruder'] = {}
@@ -17,6 +17,7 @@ import random
 from torch.optim.lr_scheduler import CosineAnnealingWarmRestarts
 import torch.nn.functional as F
 from multiprocessing import freeze_support
+import argparse
 
 def set_seed(seed=42):
     random.seed(seed)
@@ -26,7 +27,17 @@ def set_seed(seed=42):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = True  # Enable for better performance on new hardware
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="KropScan enhanced training")
+    parser.add_argument('--model-name', default='efficientnet_b0',
+                        help='timm architecture (e.g. mobilenetv3_large_100 for the cascade first stage)')
+    parser.add_argument('--model-out', default='kropscan_production_model.pth', help='Best weights output')
+    parser.add_argument('--checkpoint-out', default='kropscan_best_checkpoint.pth', help='EMA weights output')
+    parser.add_argument('--info-out', default='model_info.json', help='Model info output')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     set_seed(42)
 
     print("="*80)
@@ -43,7 +54,7 @@ def main():
 
     # ENHANCED CONFIG - Optimized for RTX 5070 + 16GB RAM
     CONFIG = {
-        'model_name': 'efficientnet_b0',  # Downgraded from B4 to B0 (reduced memory usage)
+        'model_name': args.model_name,  # efficientnet_b0 by default (reduced memory usage)
         'pretrained': True,
         'drop_path_rate': 0.2,  # Increased for regularization
 
@@ -382,12 +393,12 @@ def main():
             best_val_acc = val_acc
 
             # Save main model
-            torch.save(model.state_dict(), 'kropscan_production_model.pth')
+            torch.save(model.state_dict(), args.model_out)
 
             # Also save EMA model if enabled
             if ema is not None:
                 ema.apply_shadow(model)
-                torch.save(model.state_dict(), 'kropscan_best_checkpoint.pth')
+                torch.save(model.state_dict(), args.checkpoint_out)
                 ema.restore(model)  # Restore current weights
 
             print(f"\nNEW BEST: {best_val_acc:.2f}%")
@@ -427,16 +438,22 @@ def main():
         }
     }
 
-    with open('model_info.json', 'w') as f:
+    with open(args.info_out, 'w') as f:
         json.dump(model_info, f, indent=2)
 
+    # Fit the softmax temperature on the validation split (used for calibrated
+    # confidence, e.g. by the cascade's first-stage threshold)
+    from calibration import calibrate_model_info
+    model.load_state_dict(torch.load(args.model_out, map_location=device))
+    calibrate_model_info(model, args.info_out, val_dir, device=device)
+
     with open('training_history.json', 'w') as f:
         json.dump(history, f, indent=2)
 
     print(f"\nFiles saved:")
-    print(f"   kropscan_production_model.pth")
-    print(f"   kropscan_best_checkpoint.pth")  # EMA model
-    print(f"   model_info.json")
+    print(f"   {args.model_out}")
+    print(f"   {args.checkpoint_out}")  # EMA model
+    print(f"   {args.info_out}")
     print(f"   training_history.json")
 
     # Plot
@@ -0,0 +1,163 @@
+"""
+Treatment Knowledge Store for KropScan
+Single source of treatment text, loaded once from treatment_database.json
+
+Every entry in the database is keyed by a class name and may carry:
+- 'treatment':    English treatment text
+- 'translations': {language_code: text} for the other supported languages
+- 'aliases':      other spellings of the class (e.g. the model's 'Corn_(maize)___Common_rust_')
+- 'disease' / 'severity': display metadata
+
+Translations are partial: the shipped database only translates the generic
+'healthy' and 'default' entries, and every disease-specific entry is English
+only. A language without its own text for an entry gets the English text,
+and get_stats() reports how many entries each language actually covers.
+
+Lookups are case/punctuation-insensitive ('Tomato___Early_blight' finds
+'tomato___early_blight'). Text is rendered per language when the store is
+built, so a lookup is a dictionary hit rather than a fallback chain.
+"""
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+SUPPORTED_LANGUAGES = ('en', 'hi', 'mr', 'te', 'ta', 'kn', 'ml')
+
+DEFAULT_KEY = 'default'
+HEALTHY_KEY = 'healthy'
+FALLBACK_TEXT = "Treatment information not available. Please consult an agricultural expert."
+
+
+def normalize_key(name: str) -> str:
+    """'Corn_(maize)___Common_rust_' -> 'corn_maize_common_rust'"""
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+class TreatmentStore:
+    """
+    Normalized-key index over the treatment database with pre-rendered text
+    per language
+    """
+
+    def __init__(self, path: str = 'treatment_database.json', languages: Tuple[str, ...] = SUPPORTED_LANGUAGES):
+        """
+        Args:
+            path: Treatment database (JSON); relative paths that don't exist in
+                the working directory are looked up next to this module
+            languages: Languages to render text for (others fall back to English)
+        """
+        self.path = self._resolve_path(path)
+        self.languages = tuple(languages)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[str, str] = {}               # normalized name/alias -> entry key
+        self._rendered: Dict[Tuple[str, str], str] = {}  # (entry key, language) -> text
+        self._resolved: Dict[str, str] = {}            # raw class name -> entry key (memo)
+        self._lock = threading.Lock()
+
+        self._load()
+
+    @staticmethod
+    def _resolve_path(path: str) -> str:
+        if os.path.isabs(path) or os.path.exists(path):
+            return path
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            print(f"+ Treatment database loaded: {len(entries)} entries")
+        except (OSError, ValueError) as e:
+            print(f"! Treatment database unavailable ({e}) - using generic advice")
+            entries = {}
+
+        entries.setdefault(DEFAULT_KEY, {'disease': 'Uncertain Diagnosis', 'severity': 'UNKNOWN',
+                                         'treatment': FALLBACK_TEXT})
+        self.entries = entries
+
+        for key, entry in entries.items():
+            for name in [key, *entry.get('aliases', [])]:
+                normalized = normalize_key(name)
+                if self._index.setdefault(normalized, key) != key:
+                    print(f"! Treatment alias '{name}' already maps to '{self._index[normalized]}'")
+
+            english = entry.get('treatment') or FALLBACK_TEXT
+            translations = entry.get('translations', {})
+            for language in self.languages:
+                self._rendered[(key, language)] = translations.get(language) or english
+
+        english_only = sum(1 for entry in entries.values() if not entry.get('translations'))
+        if english_only:
+            print(f"! {english_only} treatment entries have no translations - other languages get English")
+
+    def resolve(self, class_name: str) -> str:
+        """
+        Entry key for a class name: exact/normalized match, then the generic
+        healthy entry for '*healthy' classes, then the default entry
+        """
+        key = self._resolved.get(class_name)
+        if key is not None:
+            return key
+
+        normalized = normalize_key(class_name)
+        key = self._index.get(normalized)
+        if key is None:
+            key = HEALTHY_KEY if normalized.endswith(HEALTHY_KEY) and HEALTHY_KEY in self.entries else DEFAULT_KEY
+
+        with self._lock:
+            self._resolved[class_name] = key
+        return key
+
+    def get(self, class_name: str, language: str = 'en') -> str:
+        """
+        Treatment text for a class name
+
+        Args:
+            class_name: Model class name (any casing / separator style)
+            language: Language code; unsupported languages, and entries with
+                no text in this language, get English
+
+        Returns:
+            Treatment text
+        """
+        key = self.resolve(class_name)
+        text = self._rendered.get((key, language))
+        return text if text is not None else self._rendered[(key, 'en')]
+
+    def get_entry(self, class_name: str) -> Dict[str, Any]:
+        """Raw database entry (disease, severity, ...) for a class name"""
+        return self.entries[self.resolve(class_name)]
+
+    def __contains__(self, class_name: str) -> bool:
+        return normalize_key(class_name) in self._index
+
+    def get_stats(self) -> Dict[str, Any]:
+        translated = sum(1 for entry in self.entries.values() if entry.get('translations'))
+        coverage = {
+            language: sum(1 for entry in self.entries.values()
+                          if language == 'en' or entry.get('translations', {}).get(language))
+            for language in self.languages
+        }
+        return {
+            'path': self.path,
+            'entries': len(self.entries),
+            'index_keys': len(self._index),
+            'translated_entries': translated,
+            'entries_per_language': coverage,
+            'languages': list(self.languages)
+        }
+
+
+_stores: Dict[str, TreatmentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def load_treatment_store(path: str = 'treatment_database.json') -> TreatmentStore:
+    """Process-wide TreatmentStore for a database path (built on first use)"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = TreatmentStore(path)
+        return store
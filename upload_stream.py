@@ -0,0 +1,330 @@
+"""
+Streaming Image Uploads for KropScan
+Parses multipart/form-data uploads chunk by chunk so a request never holds
+more than its byte ceiling in memory, and rejects non-images and oversized
+photos from their first bytes instead of after buffering the whole body.
+
+Accepted formats are the ones the engine decodes and sniff_image() can size
+from the header alone: JPEG, PNG and WEBP.
+"""
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ImportError:
+    try:  # python-multipart < 0.0.13
+        from multipart import MultipartParser
+        from multipart.multipart import parse_options_header
+    except ImportError:  # sniff_image() works without it, read_image_form() does not
+        MultipartParser = parse_options_header = None
+
+try:
+    from starlette.requests import ClientDisconnect
+except ImportError:  # used without Starlette
+    ClientDisconnect = ConnectionError
+
+# JPEG start-of-frame markers carry the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_JPEG_SIGNATURE = b'\xff\xd8\xff'
+UNSUPPORTED_FORMAT = "Only JPEG, PNG and WEBP images are supported"
+# EXIF thumbnails can push the JPEG frame header this far into the file
+SNIFF_LIMIT = 256 * 1024
+
+
+class UploadRejected(Exception):
+    """Upload refused before (or while) reading it; carries the HTTP status to return"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+@dataclass
+class UploadLimits:
+    """Ceilings applied while the body streams in"""
+    max_file_bytes: int = 10 * 1024 * 1024
+    max_request_bytes: int = 10 * 1024 * 1024
+    max_pixels: int = 40_000_000
+    max_side: int = 12000
+    max_files: int = 1
+    max_field_bytes: int = 4096
+
+
+@dataclass
+class UploadedImage:
+    """One accepted image part"""
+    filename: str
+    data: bytes
+    format: str
+    width: int
+    height: int
+    index: int = 0  # position among the request's file parts
+
+
+@dataclass
+class ImageForm:
+    """Parsed form: accepted images, per-file (index, filename, error) rejections and the text fields"""
+    images: List[UploadedImage] = field(default_factory=list)
+    rejected: List[Tuple[int, str, UploadRejected]] = field(default_factory=list)
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+def sniff_image(header: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Identify a JPEG, PNG or WEBP and read its dimensions from the leading bytes
+
+    Args:
+        header: The first bytes of the file (any length)
+
+    Returns:
+        (format, width, height), or None if more bytes are needed
+
+    Raises:
+        UploadRejected: Not a JPEG/PNG/WEBP, or a corrupt header
+    """
+    if len(header) < 8:
+        if (_PNG_SIGNATURE.startswith(header[:8]) or _JPEG_SIGNATURE.startswith(header[:3])
+                or b'RIFF'.startswith(header[:4])):
+            return None
+        raise UploadRejected(415, UNSUPPORTED_FORMAT)
+
+    if header.startswith(_PNG_SIGNATURE):
+        # IHDR is always the first chunk: length, type, width, height
+        if len(header) < 24:
+            return None
+        if header[12:16] != b'IHDR':
+            raise UploadRejected(400, "Corrupt PNG header")
+        width, height = struct.unpack('>II', header[16:24])
+        return 'png', width, height
+
+    if header.startswith(b'RIFF'):
+        return _sniff_webp(header)
+
+    if header.startswith(_JPEG_SIGNATURE):
+        offset = 2
+        while True:
+            # Markers may be padded with any number of 0xFF fill bytes
+            while offset < len(header) and header[offset] == 0xFF:
+                offset += 1
+            if offset >= len(header):
+                return None
+            marker = header[offset]
+            offset += 1
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                continue  # standalone markers have no length
+            if marker == 0xD9 or marker == 0xDA:
+                raise UploadRejected(400, "Corrupt JPEG header (no frame size before image data)")
+            if offset + 2 > len(header):
+                return None
+            length = struct.unpack('>H', header[offset:offset + 2])[0]
+            if length < 2:
+                raise UploadRejected(400, "Corrupt JPEG header")
+            if marker in _JPEG_SOF_MARKERS:
+                if offset + 7 > len(header):
+                    return None
+                height, width = struct.unpack('>HH', header[offset + 3:offset + 7])
+                return 'jpeg', width, height
+            offset += length
+
+    raise UploadRejected(415, UNSUPPORTED_FORMAT)
+
+
+def _sniff_webp(header: bytes) -> Optional[Tuple[str, int, int]]:
+    """Dimensions from a RIFF/WEBP header: the first chunk is VP8, VP8L or VP8X"""
+    if len(header) < 12:
+        return None
+    if header[8:12] != b'WEBP':
+        raise UploadRejected(415, UNSUPPORTED_FORMAT)
+    if len(header) < 30:
+        return None
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        # Lossy: 3-byte frame tag, start code, then 14-bit width and height
+        if header[23:26] != b'\x9d\x01\x2a':
+            raise UploadRejected(400, "Corrupt WEBP header")
+        width, height = struct.unpack('<HH', header[26:30])
+        return 'webp', width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        # Lossless: signature byte, then 14-bit width-1 and height-1
+        if header[20] != 0x2F:
+            raise UploadRejected(400, "Corrupt WEBP header")
+        bits = struct.unpack('<I', header[21:25])[0]
+        return 'webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        # Extended: flags, reserved, then 24-bit canvas width-1 and height-1
+        width = int.from_bytes(header[24:27], 'little') + 1
+        height = int.from_bytes(header[27:30], 'little') + 1
+        return 'webp', width, height
+    raise UploadRejected(400, "Corrupt WEBP header")
+
+
+class _ImagePart:
+    """Accumulates one file part, validating it as the bytes arrive"""
+
+    def __init__(self, filename: str, index: int, limits: UploadLimits):
+        self.filename = filename
+        self.index = index
+        self.limits = limits
+        self.buffer = bytearray()
+        self.info: Optional[Tuple[str, int, int]] = None
+        self.error: Optional[UploadRejected] = None
+
+    def feed(self, data: bytes):
+        if self.error is not None:
+            return  # rejected: the rest of the part is read off the wire and dropped
+        if len(self.buffer) + len(data) > self.limits.max_file_bytes:
+            self._reject(UploadRejected(
+                413, f"Image is larger than {self.limits.max_file_bytes // (1024 * 1024)} MB"))
+            return
+        self.buffer += data
+        if self.info is None:
+            self._sniff(final=False)
+
+    def finish(self) -> Optional[UploadedImage]:
+        if self.error is None and self.info is None:
+            self._sniff(final=True)
+        if self.error is not None:
+            return None
+        image_format, width, height = self.info
+        return UploadedImage(self.filename, bytes(self.buffer), image_format, width, height, self.index)
+
+    def _sniff(self, final: bool):
+        try:
+            info = sniff_image(bytes(self.buffer[:SNIFF_LIMIT]))
+            if info is None:
+                if final or len(self.buffer) >= SNIFF_LIMIT:
+                    raise UploadRejected(400, "Could not read the image dimensions")
+                return
+            _, width, height = info
+            if width == 0 or height == 0:
+                raise UploadRejected(400, "Image has no pixels")
+            if (width > self.limits.max_side or height > self.limits.max_side
+                    or width * height > self.limits.max_pixels):
+                raise UploadRejected(413, f"Image is too large ({width}x{height} pixels)")
+            self.info = info
+        except UploadRejected as e:
+            self._reject(e)
+
+    def _reject(self, error: UploadRejected):
+        self.error = error
+        self.buffer = bytearray()
+
+
+async def read_image_form(request, limits: UploadLimits, strict: bool = True) -> ImageForm:
+    """
+    Stream a multipart/form-data request body into an ImageForm
+
+    Args:
+        request: Starlette/FastAPI Request (the body must not have been read yet)
+        limits: Byte, pixel and file-count ceilings
+        strict: Raise on the first rejected file (single-image endpoints);
+            otherwise record it in ImageForm.rejected and keep going
+
+    Returns:
+        ImageForm with the accepted images in upload order
+
+    Raises:
+        UploadRejected: Malformed request, request ceiling exceeded, or (strict)
+            a rejected file
+    """
+    if MultipartParser is None:
+        raise ImportError("python-multipart is required to read uploads")
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in options:
+        raise UploadRejected(415, "Expected a multipart/form-data upload")
+
+    declared = request.headers.get('content-length')
+    # Multipart framing adds a little on top of the payload itself
+    ceiling = limits.max_request_bytes + 64 * 1024
+    if declared is not None and declared.isdigit() and int(declared) > ceiling:
+        raise UploadRejected(413, f"Upload is larger than {limits.max_request_bytes // (1024 * 1024)} MB")
+
+    form = ImageForm()
+    state = {'headers': {}, 'header_field': b'', 'part': None, 'name': None, 'value': None, 'ended': False}
+
+    def on_part_begin():
+        state.update(headers={}, part=None, name=None, value=None)
+
+    def on_header_field(data, start, end):
+        state['header_field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        name = state['header_field'].lower()
+        state['headers'][name] = state['headers'].get(name, b'') + data[start:end]
+
+    def on_header_end():
+        state['header_field'] = b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state['headers'].get(b'content-disposition', b''))
+        state['name'] = disposition.get(b'name', b'').decode('utf-8', 'replace')
+        filename = disposition.get(b'filename')
+        if filename is not None:
+            index = len(form.images) + len(form.rejected)
+            if index >= limits.max_files:
+                raise UploadRejected(413, f"At most {limits.max_files} image(s) per request")
+            state['part'] = _ImagePart(filename.decode('utf-8', 'replace'), index, limits)
+        else:
+            state['value'] = bytearray()
+
+    def on_part_data(data, start, end):
+        part = state['part']
+        if part is not None:
+            part.feed(data[start:end])
+            if strict and part.error is not None:
+                raise part.error
+        else:
+            state['value'] += data[start:end]
+            if len(state['value']) > limits.max_field_bytes:
+                raise UploadRejected(413, f"Form field '{state['name']}' is too long")
+
+    def on_part_end():
+        part = state['part']
+        if part is not None:
+            image = part.finish()
+            if image is not None:
+                form.images.append(image)
+            elif strict:
+                raise part.error
+            else:
+                form.rejected.append((part.index, part.filename, part.error))
+        elif state['value'] is not None:
+            form.fields[state['name']] = state['value'].decode('utf-8', 'replace')
+
+    def on_end():
+        state['ended'] = True
+
+    parser = MultipartParser(options[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+        'on_end': on_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > ceiling:
+                raise UploadRejected(413, f"Upload is larger than {limits.max_request_bytes // (1024 * 1024)} MB")
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejected:
+        raise
+    except ClientDisconnect:
+        raise UploadRejected(400, "Client disconnected before the upload finished")
+    except Exception as e:
+        raise UploadRejected(400, f"Malformed multipart body: {e}")
+    # The parser accepts a body that stops early; only the closing boundary proves it is whole
+    if not state['ended']:
+        raise UploadRejected(400, "Upload ended before the multipart body was complete")
+    return form
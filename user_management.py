@@ -2,11 +2,17 @@
 User Management System for KropScan
 Handles farmer registration, profiles, and treatment history
 """
-import json
-import os
 import uuid
 from datetime import datetime
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional
+from metrics import REGISTRY
+from user_store import DuplicateEmailError, UserStore, open_user_store
+
+STORAGE_WRITE_SECONDS = REGISTRY.histogram(
+    'kropscan_storage_write_seconds', 'Time to persist one store write', ('store',))
+STORAGE_WRITE_ERRORS = REGISTRY.counter(
+    'kropscan_storage_write_errors_total', 'Failed store writes', ('store',))
 
 class User:
     """Represents a user (farmer) in the system"""
@@ -37,61 +43,106 @@ class User:
 class UserManagement:
     """Manages user registration, profiles, and treatment history"""
     
-    def __init__(self, users_file="users.json"):
+    def __init__(self, users_file="users.json", store: UserStore = None):
+        """
+        Args:
+            users_file: users.json (JSON backend file; imported once by the SQLite backend)
+            store: Storage backend (default: open_user_store(users_file), see user_store.py)
+        """
         self.users_file = users_file
-        self.users = self.load_users()
-    
-    def load_users(self) -> Dict:
-        """Load users from file"""
-        if os.path.exists(self.users_file):
-            try:
-                with open(self.users_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        self.store = store if store is not None else open_user_store(users_file)
+    
+    @property
+    def users(self) -> Mapping[str, Dict]:
+        """
+        Read-only snapshot of every user keyed by user_id (reads the whole
+        store - prefer get_user / find_user_by_email; change users with update_user)
+        """
+        return MappingProxyType(self.store.all())
+    
+    def save_user(self, user: Dict) -> bool:
+        """Persist one user's record (only that row is written)"""
+        try:
+            with STORAGE_WRITE_SECONDS.labels('users').time():
+                self.store.put(user['user_id'], user)
+            return True
+        except DuplicateEmailError:
+            print(f"- Email already registered: {user.get('email')}")
+            return False
+        except Exception as e:
+            STORAGE_WRITE_ERRORS.labels('users').inc()
+            print(f"Error saving user {user.get('user_id')}: {e}")
+            return False
+    
+    def update_user(self, user_id: str, fn: Callable[[Dict], Optional[bool]]) -> bool:
+        """
+        Change one user atomically: fn edits the stored record in place (return
+        False to skip the write). Concurrent updates to the same user never
+        overwrite each other, unlike get_user() + save_user().
+
+        Returns:
+            True if the change was saved
+        """
+        try:
+            with STORAGE_WRITE_SECONDS.labels('users').time():
+                return self.store.update(user_id, fn)
+        except DuplicateEmailError as e:
+            print(f"- {e}")
+            return False
+        except Exception as e:
+            STORAGE_WRITE_ERRORS.labels('users').inc()
+            print(f"Error updating user {user_id}: {e}")
+            return False
     
     def save_users(self):
-        """Save users to file"""
+        """Save every user (JSON backend: rewrites the file; SQLite already saved each row)"""
         try:
-            with open(self.users_file, 'w') as f:
-                json.dump(self.users, f, indent=2)
+            with STORAGE_WRITE_SECONDS.labels('users').time():
+                self.store.save_all()
         except Exception as e:
+            STORAGE_WRITE_ERRORS.labels('users').inc()
             print(f"Error saving users: {e}")
     
-    def register_user(self, name: str, phone: str, location: str, farm_size: float = 0.0) -> Optional[str]:
-        """Register a new user and return user ID"""
+    def register_user(self, name: str, phone: str, location: str, farm_size: float = 0.0, **fields) -> Optional[str]:
+        """
+        Register a new user and return user ID (extra fields, e.g. email, are
+        stored with the profile). None if the save fails, including when the
+        email is already registered.
+        """
         user_id = str(uuid.uuid4())
         
-        user = User(user_id, name, phone, location, farm_size)
-        self.users[user_id] = user.to_dict()
-        self.save_users()
+        user = User(user_id, name, phone, location, farm_size).to_dict()
+        user.update(fields)
+        if not self.save_user(user):
+            return None
         
         return user_id
     
     def get_user(self, user_id: str) -> Optional[Dict]:
-        """Get user by ID"""
-        return self.users.get(user_id)
+        """Get a copy of a user's record by ID (change users with update_user())"""
+        return self.store.get(user_id)
+    
+    def find_user_by_email(self, email: str) -> Optional[Dict]:
+        """Get the user registered with an email address"""
+        return self.store.find_by_email(email)
+    
+    def find_users_by_phone(self, phone: str) -> List[Dict]:
+        """Get every user registered with a phone number"""
+        return self.store.find_by_phone(phone)
     
     def update_user_profile(self, user_id: str, **kwargs) -> bool:
         """Update user profile information"""
-        if user_id in self.users:
+        def apply(user):
             for key, value in kwargs.items():
                 if key in ['name', 'phone', 'location', 'farm_size']:
-                    self.users[user_id][key] = value
-            self.save_users()
-            return True
-        return False
+                    user[key] = value
+        return self.update_user(user_id, apply)
     
     def add_treatment_to_history(self, user_id: str, treatment_record: Dict) -> bool:
         """Add a treatment record to user's history"""
-        if user_id in self.users:
-            # Add timestamp to the record
-            treatment_record['timestamp'] = datetime.now().isoformat()
-            self.users[user_id]['treatment_history'].append(treatment_record)
-            self.save_users()
-            return True
-        return False
+        # Add timestamp to the record
+        treatment_record['timestamp'] = datetime.now().isoformat()
+        return self.update_user(user_id, lambda user: user['treatment_history'].append(treatment_record))
     
     def get_user_treatment_history(self, user_id: str) -> List[Dict]:
         """Get treatment history for a user"""
@@ -100,18 +151,14 @@ class UserManagement:
     
     def send_notification(self, user_id: str, message: str, notification_type: str = "info") -> bool:
         """Send a notification to a user"""
-        if user_id in self.users:
-            notification = {
-                'id': str(uuid.uuid4()),
-                'message': message,
-                'type': notification_type,
-                'timestamp': datetime.now().isoformat(),
-                'read': False
-            }
-            self.users[user_id]['notifications'].append(notification)
-            self.save_users()
-            return True
-        return False
+        notification = {
+            'id': str(uuid.uuid4()),
+            'message': message,
+            'type': notification_type,
+            'timestamp': datetime.now().isoformat(),
+            'read': False
+        }
+        return self.update_user(user_id, lambda user: user['notifications'].append(notification))
     
     def get_unread_notifications(self, user_id: str) -> List[Dict]:
         """Get unread notifications for a user"""
@@ -122,13 +169,13 @@ class UserManagement:
     
     def mark_notification_as_read(self, user_id: str, notification_id: str) -> bool:
         """Mark a notification as read"""
-        if user_id in self.users:
-            for notification in self.users[user_id]['notifications']:
+        def mark(user):
+            for notification in user['notifications']:
                 if notification['id'] == notification_id:
                     notification['read'] = True
-                    self.save_users()
                     return True
-        return False
+            return False
+        return self.update_user(user_id, mark)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,379 @@
+"""
+User Storage for KropScan
+Persistence behind UserManagement: one record (a JSON-serializable dict) per
+user, keyed by user_id, with lookups by email and phone.
+
+- SqliteUserStore: one row per user in a WAL-mode database. Writes touch only
+  the changed row, several processes can share the file, and email/phone
+  lookups use indexes. The first open imports an existing users.json.
+- JsonUserStore: the original users.json file, rewritten on every change.
+  Handy for development (readable, diffable), not for production.
+
+Both backends hand out copies of the records: edit one and put() it back, or
+use update() for a read-modify-write that cannot lose a concurrent change.
+An email address belongs to at most one user (DuplicateEmailError).
+
+Usage:
+    store = open_user_store('users.json')              # backend from KROPSCAN_USER_STORE
+    store = open_user_store('users.json', 'json')      # force the JSON file
+
+    store.update(user_id, lambda user: user['notifications'].append(note))
+
+    python user_store.py migrate --json users.json --db database/users.db
+"""
+import argparse
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_DB_PATH = 'database/users.db'
+
+
+class DuplicateEmailError(ValueError):
+    """A write would give two users the same email address"""
+
+
+class UserStore:
+    """Storage interface used by UserManagement"""
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        """User record, or None"""
+        raise NotImplementedError
+
+    def put(self, user_id: str, record: Dict):
+        """
+        Insert or replace one user's record
+
+        Raises:
+            DuplicateEmailError: Another user already has the record's email
+        """
+        raise NotImplementedError
+
+    def update(self, user_id: str, fn: Callable[[Dict], Optional[bool]]) -> bool:
+        """
+        Read-modify-write one record atomically (no other writer runs in between)
+
+        Args:
+            user_id: User to change
+            fn: Edits the record in place; returning False leaves it unsaved
+
+        Returns:
+            True if the record was saved, False if there is no such user or fn declined
+
+        Raises:
+            DuplicateEmailError: fn gave the user another user's email
+        """
+        raise NotImplementedError
+
+    def delete(self, user_id: str) -> bool:
+        """Remove a user; False if there was none"""
+        raise NotImplementedError
+
+    def find_by_email(self, email: str) -> Optional[Dict]:
+        """First user registered with this email, or None"""
+        raise NotImplementedError
+
+    def find_by_phone(self, phone: str) -> List[Dict]:
+        """Every user registered with this phone number (families share phones)"""
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict]:
+        """Every user, keyed by user_id (reads the whole store)"""
+        raise NotImplementedError
+
+    def save_all(self):
+        """Flush everything (only the JSON store has unsaved in-memory state)"""
+
+    def close(self):
+        pass
+
+    def __len__(self) -> int:
+        return len(self.all())
+
+
+class JsonUserStore(UserStore):
+    """
+    Whole users.json held in memory and rewritten on each write. Only one
+    process may write the file.
+    """
+
+    def __init__(self, path: str = 'users.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self.users: Dict[str, Dict] = load_json_users(path)
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        return copy.deepcopy(self.users.get(user_id))
+
+    def put(self, user_id: str, record: Dict):
+        with self._lock:
+            self._check_email(user_id, record)
+            self.users[user_id] = copy.deepcopy(record)
+            self._write()
+
+    def update(self, user_id: str, fn: Callable[[Dict], Optional[bool]]) -> bool:
+        with self._lock:
+            if user_id not in self.users:
+                return False
+            record = copy.deepcopy(self.users[user_id])
+            if fn(record) is False:
+                return False
+            self._check_email(user_id, record)
+            self.users[user_id] = record
+            self._write()
+            return True
+
+    def _check_email(self, user_id: str, record: Dict):
+        email = record.get('email')
+        if email is None:
+            return
+        for other_id, other in self.users.items():
+            if other_id != user_id and other.get('email') == email:
+                raise DuplicateEmailError(f"email already registered: {email}")
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock:
+            if self.users.pop(user_id, None) is None:
+                return False
+            self._write()
+            return True
+
+    def find_by_email(self, email: str) -> Optional[Dict]:
+        for record in self.users.values():
+            if record.get('email') == email:
+                return copy.deepcopy(record)
+        return None
+
+    def find_by_phone(self, phone: str) -> List[Dict]:
+        return [copy.deepcopy(record) for record in self.users.values() if record.get('phone') == phone]
+
+    def all(self) -> Dict[str, Dict]:
+        return copy.deepcopy(self.users)
+
+    def save_all(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        # Temp file + rename so a crash mid-write never truncates users.json
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.users, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+
+class SqliteUserStore(UserStore):
+    """
+    Users in SQLite (WAL): one row per user with the record as JSON, plus
+    email and phone columns copied out of it for the indexes
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, migrate_from: Optional[str] = None):
+        """
+        Args:
+            path: Database file
+            migrate_from: users.json to import the first time the database is
+                opened (skipped once any import has run)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id TEXT PRIMARY KEY,"
+            " email TEXT,"
+            " phone TEXT,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._create_email_index()
+
+        if migrate_from and self._meta('migrated_from') is None:
+            self.migrate_json(migrate_from)
+
+    def _create_email_index(self):
+        # One user per email; replaces the plain index of earlier databases
+        try:
+            with self._conn:
+                self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique"
+                                   " ON users(email) WHERE email IS NOT NULL")
+                self._conn.execute("DROP INDEX IF EXISTS idx_users_email")
+        except sqlite3.IntegrityError:
+            print(f"! {self.path} has users sharing an email; uniqueness is not enforced until they are merged")
+            with self._conn:
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _row(user_id: str, record: Dict, now: float) -> tuple:
+        return (user_id, record.get('email'), record.get('phone'), json.dumps(record), now)
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        Import a users.json in one transaction (existing rows win, and of
+        several users with one email only the first is imported)
+
+        Returns:
+            Number of users imported
+        """
+        users = load_json_users(json_path)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.executemany(
+                    "INSERT OR IGNORE INTO users (user_id, email, phone, data, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [self._row(user_id, dict(record, user_id=record.get('user_id', user_id)), now)
+                     for user_id, record in users.items()]
+                )
+                imported = max(cursor.rowcount, 0)
+                # Only a users.json that was actually read counts: one that
+                # shows up later must still be imported
+                if os.path.exists(json_path):
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                                       (os.path.abspath(json_path),))
+        if users:
+            print(f"+ Migrated {imported} users from {json_path} to {self.path}")
+            if imported < len(users):
+                print(f"! Skipped {len(users) - imported} users already in the database or with a duplicate email")
+        return imported
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id: str, record: Dict):
+        # An upsert, not INSERT OR REPLACE: REPLACE would delete whichever
+        # other user holds the email instead of failing
+        try:
+            with self._lock:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO users (user_id, email, phone, data, updated_at) VALUES (?, ?, ?, ?, ?)"
+                        " ON CONFLICT(user_id) DO UPDATE SET email = excluded.email, phone = excluded.phone,"
+                        " data = excluded.data, updated_at = excluded.updated_at",
+                        self._row(user_id, record, time.time())
+                    )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateEmailError(f"email already registered: {record.get('email')}") from e
+
+    def update(self, user_id: str, fn: Callable[[Dict], Optional[bool]]) -> bool:
+        with self._lock:
+            # IMMEDIATE takes the write lock before the read, so another
+            # process cannot change the row between our read and write
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                record = json.loads(row[0]) if row else None
+                if record is None or fn(record) is False:
+                    self._conn.rollback()
+                    return False
+                _, email, phone, data, now = self._row(user_id, record, time.time())
+                self._conn.execute("UPDATE users SET email = ?, phone = ?, data = ?, updated_at = ? WHERE user_id = ?",
+                                   (email, phone, data, now, user_id))
+                self._conn.commit()
+                return True
+            except sqlite3.IntegrityError as e:
+                self._conn.rollback()
+                raise DuplicateEmailError(f"email already registered: {record.get('email')}") from e
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock:
+            with self._conn:
+                return self._conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def find_by_email(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE email = ? ORDER BY rowid LIMIT 1", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_phone(self, phone: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM users WHERE phone = ? ORDER BY rowid", (phone,)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def all(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM users ORDER BY rowid").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def load_json_users(path: str) -> Dict[str, Dict]:
+    """Read a users.json ({} if missing or unreadable)"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"- Could not read {path}: {e}")
+        return {}
+
+
+def open_user_store(users_file: str = 'users.json', backend: Optional[str] = None,
+                    db_path: Optional[str] = None) -> UserStore:
+    """
+    Storage for UserManagement
+
+    Args:
+        users_file: users.json (the JSON backend's file; imported into SQLite once)
+        backend: 'sqlite' or 'json' (default: KROPSCAN_USER_STORE, else 'sqlite')
+        db_path: SQLite file (default: KROPSCAN_USER_DB, else database/users.db)
+    """
+    backend = backend or os.getenv('KROPSCAN_USER_STORE', 'sqlite')
+    if backend == 'json':
+        return JsonUserStore(users_file)
+    if backend != 'sqlite':
+        raise ValueError(f"unknown user store backend: {backend}")
+    return SqliteUserStore(db_path or os.getenv('KROPSCAN_USER_DB', DEFAULT_DB_PATH), migrate_from=users_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage KropScan user storage")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='Import users.json into the SQLite store')
+    migrate.add_argument('--json', default='users.json', help='users.json to import')
+    migrate.add_argument('--db', default=DEFAULT_DB_PATH, help='SQLite database')
+    args = parser.parse_args()
+
+    store = SqliteUserStore(args.db)
+    store.migrate_json(args.json)
+    print(f"+ {len(store)} users in {args.db}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()